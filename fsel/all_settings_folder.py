@@ -1,31 +1,214 @@
+import fcntl
 import json
 import os
-from typing import Set, AnyStr
+import time
+from typing import AnyStr, Callable, Dict, List, Set
+
+from fsel.lib.logging import debug
+from fsel.lib.path_oracle import PathOracle, SHARD
+from fsel.roots_registry import RootsRegistry
+from fsel.sdk import field_or_else
+from fsel.settings_journal import SettingsJournal
+from fsel.usage_stats_gc import UsageStatsGc
 
 
 class AllSettingsFolder:
-    roots: Set[str] = set()
+    """
+    Settings of every root are kept in a JSON file, plus a journal of changes, appended by every session.
+    The journal is folded into the settings on load, and compacted into the settings file when it grows.
+    Writers take an exclusive lock on the journal, readers a shared one.
+
+    The settings file holds only the top level of usage stats; the children of every top-level entry
+    are kept in a separate shard file, that is loaded only when PathOracle walks into the entry (see shard_loader).
+    Shards, that grow above MAX_SHARD_ENTRIES, are split further by path segments (see split_shards).
+    """
+    COMPACT_JOURNAL_SIZE = 64 * 1024
+    MAX_SHARD_ENTRIES = 5000
+
+    roots: RootsRegistry
+    unsharded: Set[str]
 
     def __init__(self, all_settings_folder: str):
-        os.makedirs(all_settings_folder, exist_ok=True)
         self.all_settings_folder = all_settings_folder
-        for entry in os.scandir(all_settings_folder):
-            if entry.is_file():
-                self.roots.add(entry.name.replace('\\', '/'))
+        self.roots = RootsRegistry(all_settings_folder + '/.roots')
+        self.unsharded = set()
+        if not self.roots.load():
+            self.migrate_roots()
+
+    def migrate_roots(self):
+        """ Build the roots registry from the names of settings files (as they were found before the registry) """
+        try:
+            for entry in os.scandir(self.all_settings_folder):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    self.roots.add(entry.name.replace('\\', '/'))
+            if len(self.roots) > 0:
+                self.roots.store()
+        except OSError:
+            pass
 
     def load_settings(self, root: AnyStr):
+        try:
+            with open(self.journal_file(root)) as journal:
+                fcntl.flock(journal, fcntl.LOCK_SH)
+                settings = self.read_settings(root)
+                SettingsJournal.fold(settings, journal, self.shard_loader(root))
+                return settings
+        except FileNotFoundError:
+            return self.read_settings(root)
+        except OSError as e:
+            debug('AllSettingsFolder.load_settings', root=root, error=str(e))
+            return self.read_settings(root)
+
+    def read_settings(self, root: AnyStr):
         try:
             with open(self.settings_file(root)) as json_file:
-                return json.load(json_file)
+                settings = json.load(json_file)
         except:
             return {}
+        PathOracle.migrate(settings.get('usage_stats') or {}, time.time())
+        if AllSettingsFolder.is_unsharded(settings.get('usage_stats') or {}):
+            self.unsharded.add(root)  # written before sharding: will be split on the next append
+        return settings
+
+    @staticmethod
+    def is_unsharded(usage_stats: Dict) -> bool:
+        return any(
+            isinstance(entry, dict) and SHARD not in entry and any(k != '.' for k in entry)
+            for entry in usage_stats.values()
+        )
+
+    def shard_loader(self, root: AnyStr) -> Callable[[AnyStr], Dict]:
+        return lambda shard: self.load_shard(root, shard)
+
+    def load_shard(self, root: AnyStr, shard: AnyStr) -> Dict:
+        try:
+            with open(self.usage_folder(root) + '/' + shard) as f:
+                shard_stats = json.load(f)
+        except (OSError, ValueError) as e:
+            debug('AllSettingsFolder.load_shard', root=root, shard=shard, error=str(e))
+            return {}
+        PathOracle.migrate(shard_stats, time.time())
+        return shard_stats
+
+    def append(self, journal: SettingsJournal, root: AnyStr):
+        """ Append the changes to the journal; the cost does not depend on the size of the settings """
+        if not journal.records:
+            return
+        try:
+            os.makedirs(self.all_settings_folder + '/journals', exist_ok=True)
+            with open(self.journal_file(root), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(journal.lines())
+                f.flush()
+                journal_size = f.tell()
+            self.roots.register(root)
+            if journal_size > AllSettingsFolder.COMPACT_JOURNAL_SIZE or root in self.unsharded:
+                self.compact(root)
+        except OSError as e:
+            debug('AllSettingsFolder.append', root=root, error=str(e))
+
+    def compact(self, root: AnyStr):
+        """ Fold the journal into the settings file, evict the coldest usage stats, and truncate the journal """
+        with open(self.journal_file(root), 'r+') as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            settings = self.read_settings(root)
+            SettingsJournal.fold(settings, journal, self.shard_loader(root))
+            gc = UsageStatsGc(field_or_else(settings, 'usage_stats', {}), self.shard_loader(root))
+            gc.load_all()
+            evicted = gc.evict_coldest(UsageStatsGc.node_budget(settings))
+            gc.prune_history(field_or_else(settings, 'history', {}))
+            debug('AllSettingsFolder.compact', root=root, evicted=evicted)
+            self.save(settings, root)
+            journal.truncate(0)
+        self.unsharded.discard(root)
 
     def save(self, settings, root: AnyStr):
+        usage_stats = settings.get('usage_stats')
+        if usage_stats:
+            settings = dict(settings, usage_stats=self.save_shards(usage_stats, root))
+        os.makedirs(self.all_settings_folder, exist_ok=True)
+        AllSettingsFolder.write_json(self.settings_file(root), settings, indent=2, sort_keys=True)
+
+    def save_shards(self, usage_stats: Dict, root: AnyStr) -> Dict:
+        """ Writes children of top-level entries to shards, and returns the top level, to be kept in the settings """
+        shards = {}
+        top_level = self.split_shards(usage_stats, root, [], True, shards)
+        self.remove_orphan_shards(shards, root)
+        return top_level
+
+    def split_shards(self, stats: Dict, root: AnyStr, path: List[AnyStr], split: bool, shards: Dict[str, bool]) -> Dict:
+        """
+        Returns stats, where the children of the entries are replaced by references to the shards, they are written to:
+        if split, or if the entries had shards before. The names of the shards are added to shards (with True,
+        if the shard has been written, or False, if it has been kept as it was).
+        A shard, that has more than MAX_SHARD_ENTRIES entries, is split in turn, by the next path segment.
+        """
+        result = {}
+        for name, entry in stats.items():
+            if not isinstance(entry, dict):
+                result[name] = entry
+                continue
+            counter = {k: v for k, v in entry.items() if k == '.'}
+            children = {k: v for k, v in entry.items() if k != '.' and k != SHARD}
+            if SHARD in entry:
+                if not children:
+                    result[name] = entry  # shard was not loaded, nor changed
+                    shards[entry[SHARD]] = False
+                    continue
+                # counted by the journal, while the shard was not loaded
+                shard = self.load_shard(root, entry[SHARD])
+                PathOracle.merge_stats(shard, children)
+                children = shard
+            elif not split:
+                result[name] = {**counter, **self.split_shards(children, root, [*path, name], False, shards)}
+                continue
+            if children:
+                shard_name = '/'.join([*path, name]).replace('/', '\\')
+                split_children = AllSettingsFolder.count_entries(children) > AllSettingsFolder.MAX_SHARD_ENTRIES
+                children = self.split_shards(children, root, [*path, name], split_children, shards)
+                os.makedirs(self.usage_folder(root), exist_ok=True)
+                AllSettingsFolder.write_json(self.usage_folder(root) + '/' + shard_name, children, separators=(',', ':'))
+                shards[shard_name] = True
+                result[name] = {**counter, SHARD: shard_name}
+            else:
+                result[name] = counter
+        return result
+
+    @staticmethod
+    def count_entries(stats: Dict) -> int:
+        """ Number of the entries in stats (except those in the shards, that are not loaded) """
+        return sum(1 + AllSettingsFolder.count_entries(entry) for entry in stats.values() if isinstance(entry, dict))
+
+    def remove_orphan_shards(self, shards: Dict[str, bool], root: AnyStr):
+        """ Removes the shards, that are not in shards, nor split from the shards, that have been kept as they were """
         try:
-            with open(self.settings_file(root), 'w') as f:
-                json.dump(settings, f, indent=2, sort_keys=True)
-        except:
+            for entry in os.scandir(self.usage_folder(root)):
+                if entry.name in shards or entry.name.endswith('.tmp'):
+                    continue
+                prefix = entry.name
+                while '\\' in prefix and shards.get(prefix) is not False:
+                    prefix = prefix.rpartition('\\')[0]
+                if shards.get(prefix) is not False:
+                    os.unlink(entry.path)
+        except OSError:
             pass
 
+    @staticmethod
+    def write_json(file_name: str, value, **kwargs):
+        tmp_file_name = f'{file_name}.{os.getpid()}.tmp'
+        with open(tmp_file_name, 'w') as f:
+            json.dump(value, f, **kwargs)
+        os.replace(tmp_file_name, file_name)
+
     def settings_file(self, root):
         return self.all_settings_folder + '/' + root.replace('/', '\\')
+
+    def journal_file(self, root):
+        return self.all_settings_folder + '/journals/' + root.replace('/', '\\')
+
+    def usage_folder(self, root):
+        return self.all_settings_folder + '/usage/' + root.replace('/', '\\')
+
+    def snapshot_file(self, root, variant: str):
+        """ Like journals and usage shards, snapshots live in a sub-folder, so that they are not mistaken for roots """
+        return self.all_settings_folder + '/snapshots/' + root.replace('/', '\\') + '#' + variant
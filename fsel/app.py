@@ -8,23 +8,173 @@
 # -W    search root from work dir (nearest root from ~/.cache/fsel)
 # -f    show files
 # -r    return relative path
+# -z    fuzzy search: typed characters match in order, not necessarily adjacent; matches are ranked
+# -G    list the paths, tracked in the git index, instead of reading folders (falls back to the file system)
+# -u    with -G, list untracked entries of tracked folders, too
+# -g    decorate entries with their git status (modified, untracked, ignored), obtained in the background
+# -i    hide entries, matched by .gitignore/.ignore files
+# -I    show entries, matched by .gitignore/.ignore files, dimmed (their contents are not prefetched or indexed)
+# --timing  report durations of startup phases to stderr
 ###
+# TUI modules are imported lazily, after the arguments are parsed, and the root and settings are found:
+# paths that exit early do not pay for them.
+###
+from fsel.lib.timing import startup_timing
+
 import os
 import sys
-from typing import Set, Dict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
 
 from fsel.all_settings_folder import AllSettingsFolder
-from fsel.fs_lister import FsListFiles
-from fsel.lib.item_selection_dialog import ItemSelectionDialog
-from fsel.lib.list_boxes import ListBoxes
 from fsel.lib.list_item import ListItem
-from fsel.lib.list_item_info_service import list_item_info_service
 from fsel.lib.logging import debug
-from fsel.lib.path_oracle import PathOracle
-from fsel.lib.select_path_dialog import SelectPathDialog
+from fsel.roots_registry import RootsRegistry
 from fsel.sdk import run_dialog, full_path, field_or_else
-
-RECENT_COUNT = 10
+from fsel.settings_journal import SettingsJournal
+from fsel.usage_stats_gc import UsageStatsGc, check_in_background
+
+if TYPE_CHECKING:
+    from fsel.fs_lister import FsListFiles
+    from fsel.fs_listing_cache import FsListingCache
+    from fsel.git_index import GitIndex
+    from fsel.git_index_lister import GitIndexListFiles
+    from fsel.git_status import GitStatus
+    from fsel.project_index import ProjectIndex
+
+class FsAppState:
+    """
+    State, that can be shared by consecutive sessions (see fsel.server).
+    Sessions of the server run in forked children, so what a session builds is lost with it:
+    its report() tells the server what to build (or bring up to date) in the parent with warm_up(),
+    to be inherited by the next sessions.
+    """
+    listing_caches: Dict[Tuple[str, bool, bool, bool, Optional[str]], 'FsListingCache']
+    git_indexes: Dict[str, 'GitIndex']
+    git_listers: Dict[Tuple[str, bool, bool, bool, Optional[str], bool], 'GitIndexListFiles']
+    git_statuses: Dict[str, Optional['GitStatus']]
+    project_indexes: Dict[Tuple[str, str], 'ProjectIndex']
+
+    def __init__(self):
+        self.all_settings = AllSettingsFolder(os.getenv("HOME") + "/.cache/fsel")
+        self.listing_caches = {}
+        self.git_indexes = {}
+        self.git_listers = {}
+        self.git_statuses = {}
+        self.project_indexes = {}
+
+    def listing_cache(self, root: str, select_files: bool, executables: bool, dot_files: bool,
+                      ignored: Optional[str] = None) -> 'FsListingCache':
+        from fsel.fs_lister import FsListFiles
+        from fsel.fs_listing_cache import FsListingCache
+
+        key = (root, select_files, executables, dot_files, ignored)
+        cache = self.listing_caches.get(key)
+        if cache is None:
+            cache = self.listing_caches[key] = FsListingCache(FsListFiles(*key))
+        return cache
+
+    def git_index_lister(self, root: str, select_files: bool, executables: bool, dot_files: bool,
+                         ignored: Optional[str] = None, untracked: bool = False) -> Optional['GitIndexListFiles']:
+        """ Lister of the paths in the git index of the work tree of the root (re-read, if changed); None if none """
+        from fsel.git_index import GitIndex
+        from fsel.git_index_lister import GitIndexListFiles
+
+        git_index = self.git_indexes.get(root)
+        if git_index is None or not git_index.refresh():
+            git_index = GitIndex.for_path(root)
+            if git_index is None:
+                return None
+            self.git_indexes[root] = git_index
+
+        key = (root, select_files, executables, dot_files, ignored, untracked)
+        lister = self.git_listers.get(key)
+        if lister is None or lister.git_index is not git_index:
+            lister = self.git_listers[key] = GitIndexListFiles(git_index, *key)
+        return lister
+
+    def git_status(self, root: str) -> Optional['GitStatus']:
+        """ Git status of the work tree of the root, being brought up to date in the background; None if not in git """
+        from fsel.git_status import GitStatus
+
+        if root not in self.git_statuses:
+            self.git_statuses[root] = GitStatus.for_path(root)
+        git_status = self.git_statuses[root]
+        if git_status is not None:
+            git_status.refresh_in_background()
+        return git_status
+
+    def project_index(self, lister: 'FsListFiles') -> 'ProjectIndex':
+        """ Not built until global search is started; then kept, and brought up to date by the next sessions """
+        from fsel.project_index import ProjectIndex
+
+        key = (lister.root, lister.variant())
+        index = self.project_indexes.get(key)
+        if index is None:
+            index = self.project_indexes[key] = ProjectIndex(lister)
+        index.lister = lister  # the same listing options, but the lister of the git index may have been renewed
+        return index
+
+    @staticmethod
+    def lister_key(lister: 'FsListFiles') -> List:
+        """ Arguments of listing_cache() (with None), or of git_index_lister() (with untracked), that make the lister """
+        from fsel.git_index_lister import GitIndexListFiles
+
+        untracked = lister.untracked if isinstance(lister, GitIndexListFiles) else None
+        return [lister.root, lister.select_files, lister.executables, lister.dot_files, lister.ignored, untracked]
+
+    def report(self) -> Dict:
+        """
+        Known roots, which folders have been listed by every listing cache,
+        and which git indexes have been read, git statuses obtained and project indexes built
+        """
+        return {
+            'roots': sorted(self.all_settings.roots),
+            'listings': [[list(key), [list(p) for p in cache.entries.keys()]] for key, cache in self.listing_caches.items()],
+            'git_listers': [list(key) for key in self.git_listers.keys()],
+            'git_statuses': [root for root, git_status in self.git_statuses.items() if git_status is not None],
+            'project_indexes': [
+                FsAppState.lister_key(index.lister) for index in self.project_indexes.values()
+                if index.signatures or index.is_building()
+            ],
+        }
+
+    def warm_up(self, report: Dict):
+        """
+        Pick up the roots, list the folders and read the git indexes from the report of another session;
+        bring the git statuses and the project indexes, that it has used, up to date in the background (see locked())
+        """
+        self.all_settings.roots.update(report['roots'])
+        for key, paths in report['listings']:
+            cache = self.listing_cache(*key)
+            for p in paths:
+                cache(p)
+        for key in report.get('git_listers', []):
+            self.git_index_lister(*key)  # re-read, if the index has changed
+        for root in report.get('git_statuses', []):
+            self.git_status(root)  # re-run, if the index or the work tree has changed
+        for *key, untracked in report.get('project_indexes', []):
+            lister = None if untracked is None else self.git_index_lister(*key, untracked)
+            self.project_index(lister or self.listing_cache(*key).delegate).start()
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the locks of the git statuses and the project indexes, for the server to fork a session:
+        the work in progress stays in the server, and the session inherits the last finished git statuses,
+        and the project indexes between two folders; it refreshes the git statuses in the background
+        (see GitStatus.refresh_in_background), and catches up with the folders, that have not been walked yet,
+        when it starts a project index itself
+        """
+        locks = [git_status.lock for git_status in self.git_statuses.values() if git_status is not None]
+        locks += [index.lock for index in self.project_indexes.values()]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in locks:
+                lock.release()
 
 
 class FsApp:
@@ -35,6 +185,10 @@ class FsApp:
 class AppSelectRecent(FsApp):
 
     def run(self, recent_items: list[ListItem]):
+        from fsel.lib.item_selection_dialog import ItemSelectionDialog
+        from fsel.lib.list_item_info_service import list_item_info_service
+        startup_timing.mark('tui import')
+
         exit_code, items_path = run_dialog(
             lambda screen_height, screen_width, cursor_y, cursor_x:
             ItemSelectionDialog(screen_height, screen_width, 0, 0, cursor_y, recent_items)
@@ -46,33 +200,58 @@ class AppSelectRecent(FsApp):
 
 class AppSelectInPanes(FsApp):
 
-    def run(self, path: str, fs_lister, root_history: Dict, usage_stats: Dict):
-        fs_oracle = PathOracle(root_history, usage_stats)
+    def run(self, path: str, fs_lister, root_history: Dict, usage_stats: Dict, details_resolver=None,
+            on_persistent_memorize=None, shard_loader=None, fuzzy=False, project_index=None, decorations=None,
+            invalidator=None, revalidations=None):
+        from fsel.lib.inotify import FolderWatcher
+        from fsel.lib.list_boxes import ListBoxes
+        from fsel.lib.path_oracle import PathOracle
+        from fsel.lib.prefetcher import Prefetcher
+        from fsel.lib.select_path_dialog import SelectPathDialog
+        startup_timing.mark('tui import')
+
+        fs_oracle = PathOracle(root_history, usage_stats, on_persistent_memorize, shard_loader)
 
         rel_path = os.path.relpath(path, self.root)
         debug("AppSelectInPanes.run", path=path, rel_path=rel_path)
         initial_path = rel_path.split('/') if rel_path != '.' else []
-        folder_lists = ListBoxes(fs_lister, fs_oracle, initial_path)
+        watcher = FolderWatcher.create(self.root)
+        prefetcher = Prefetcher(fs_lister, fs_lister.signature)
+        folder_lists = ListBoxes(
+            fs_lister, fs_oracle, initial_path, prefetcher, fs_lister.stream, details_resolver, fuzzy,
+            decorations, watcher, invalidator, revalidations
+        )
+        startup_timing.mark('first listing')
         if folder_lists.is_empty():
             sys.exit(2)
 
-        exit_code, items_path = run_dialog(
-            lambda screen_height, screen_width, cursor_y, cursor_x:
-            SelectPathDialog(folder_lists, screen_width, screen_height, width=1000, height=0, x=0, y=cursor_y)
-        )
+        try:
+            exit_code, items_path = run_dialog(
+                lambda screen_height, screen_width, cursor_y, cursor_x:
+                SelectPathDialog(
+                    folder_lists, screen_width, screen_height, width=1000, height=0, x=0, y=cursor_y,
+                    project_index=project_index
+                )
+            )
+        finally:
+            folder_lists.close()
+            if watcher is not None:
+                watcher.close()
         if items_path is None:
             sys.exit(1)
         return exit_code, self.full_path(items_path)
 
     def full_path(self, items_path):
+        from fsel.lib.list_item_info_service import list_item_info_service
         return os.path.join(self.root, *[list_item_info_service.item_file_name(i) for i in items_path])
 
 
-def find_root(folder: str, roots: Set[str]) -> tuple[str, str]:
+def find_root(folder: str, roots: RootsRegistry) -> tuple[str, str]:
     root_candidate = folder if not folder.endswith('/') else folder[:len(folder) - 1]
+    registered_root = roots.owning_root(root_candidate)
 
     while True:
-        if root_candidate in roots:
+        if root_candidate == registered_root:
             return root_candidate, folder
         if root_candidate == os.getenv('HOME') or root_candidate == '' or root_candidate.startswith('.'):
             return root_candidate, folder
@@ -90,15 +269,16 @@ def find_root(folder: str, roots: Set[str]) -> tuple[str, str]:
         root_candidate = parent_path
 
 
-def update_recents(recent, rel_path_from_root):
-    if rel_path_from_root != '.':
-        if rel_path_from_root in recent:
-            recent.remove(rel_path_from_root)
-        recent.insert(0, rel_path_from_root)
-        del recent[RECENT_COUNT:]
+def main(state: FsAppState = None):
+    startup_timing.enabled = '--timing' in sys.argv[1:]
+    startup_timing.mark('import')
+    try:
+        select(state)
+    finally:
+        startup_timing.report()
 
 
-def main():
+def select(state: FsAppState = None):
     path_args = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
     wd = os.getenv('PWD')
     folder = wd if len(path_args) != 1 else os.path.realpath(path_args[0])
@@ -110,14 +290,25 @@ def main():
     target_is_executable = '-x' in sys.argv[1:]
     show_dot_files = '-a' in sys.argv[1:]
     show_recent = '-e' in sys.argv[1:]
+    fuzzy_search = '-z' in sys.argv[1:]
+    use_git_index = '-G' in sys.argv[1:]
+    list_untracked = '-u' in sys.argv[1:]
+    show_git_status = '-g' in sys.argv[1:]
+    if '-i' in sys.argv[1:]:
+        ignored = 'hide'
+    elif '-I' in sys.argv[1:]:
+        ignored = 'dim'
+    else:
+        ignored = None
     if target_is_file:
         field_for_recent = 'recent-executables' if target_is_executable else 'recent-files'
     else:
         field_for_recent = 'recent-folders'
-    all_settings = AllSettingsFolder(os.getenv("HOME") + "/.cache/fsel")
+    state = state or FsAppState()
+    all_settings = state.all_settings
 
     if use_vcs_root:
-        root, folder = find_root(folder, set())
+        root, folder = find_root(folder, RootsRegistry())
     elif search_root_from_work_dir:
         root, _ = find_root(wd, all_settings.roots)
         rel_path = os.path.relpath(folder, root)
@@ -126,8 +317,11 @@ def main():
     else:
         root, folder = find_root(folder, all_settings.roots)
     debug("main", root=root, folder=folder)
+    startup_timing.mark('root discovery')
 
     settings_for_root = all_settings.load_settings(root)
+    journal = SettingsJournal()
+    startup_timing.mark('settings load')
     recent = field_or_else(settings_for_root, field_for_recent, [])
 
     if show_recent:
@@ -142,19 +336,49 @@ def main():
         exit_code, path = app.run([ListItem(name=name, attrs=0, description=None) for name in recent])
     else:
         app = AppSelectInPanes(displayed_root or root)
-        exit_code, path = app.run(
-            folder,
-            FsListFiles(app.root, target_is_file, target_is_executable, show_dot_files),
-            root_history=field_or_else(settings_for_root, 'history', {}),
-            usage_stats=field_or_else(settings_for_root, 'usage_stats', {})
-        )
+        if displayed_root is None and UsageStatsGc.is_check_due(settings_for_root):
+            # usage stats are relative to the displayed root, but kept with the settings of the root: check only if same
+            check_in_background(all_settings, root, journal)
+        listing_key = (app.root, target_is_file, target_is_executable, show_dot_files, ignored)
+        git_lister = state.git_index_lister(*listing_key, list_untracked) if use_git_index else None
+        if git_lister is not None:
+            # listings come from memory: neither cached nor kept in the snapshot
+            fs_list_files = entry_lister = git_lister
+            snapshot = fs_listing_cache = None
+        else:
+            if use_git_index:
+                debug('select', git_index=None, root=app.root)
+            fs_listing_cache = state.listing_cache(*listing_key)
+            fs_list_files = fs_listing_cache.delegate
+            from fsel.fs_snapshot import FsSnapshot, SnapshotListFiles
+            snapshot = FsSnapshot(all_settings.snapshot_file(app.root, fs_list_files.variant())).load()
+            entry_lister = SnapshotListFiles(fs_listing_cache, snapshot)
+        try:
+            exit_code, path = app.run(
+                folder,
+                entry_lister,
+                root_history=field_or_else(settings_for_root, 'history', {}),
+                usage_stats=field_or_else(settings_for_root, 'usage_stats', {}),
+                details_resolver=fs_list_files.resolve_details,
+                on_persistent_memorize=journal.memorize,
+                shard_loader=all_settings.shard_loader(root),
+                fuzzy=fuzzy_search,
+                project_index=state.project_index(fs_list_files),
+                decorations=state.git_status(app.root) if show_git_status else None,
+                invalidator=None if fs_listing_cache is None else fs_listing_cache.invalidate,
+                revalidations=None if snapshot is None else entry_lister
+            )
+        finally:
+            if snapshot is not None:
+                snapshot.save()
+                fs_listing_cache.report()
 
     if path is None:
         sys.exit(1)
 
     rel_path_from_root = os.path.relpath(path, start=app.root)
-    update_recents(recent, rel_path_from_root)
-    all_settings.save(settings_for_root, root)
+    journal.recent(field_for_recent, rel_path_from_root)
+    all_settings.append(journal, root)
     ret_rel_path = '-r' in sys.argv[1:]
     ret_rel_path_from_root = '-R' in sys.argv[1:]
     if ret_rel_path:
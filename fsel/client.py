@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+###
+# Thin client of fsel.server.
+# Passes the terminal (stdin, stdout, stderr), the arguments and the working directory to the server,
+# and exits with the exit code of the session.
+# If the server is not running, runs fsel.app in-process instead.
+# The terminal is passed only to a server of the same user, listening on a socket in a private folder.
+###
+# Arguments: same as fsel.app
+###
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+
+
+def socket_path() -> str:
+    """ In XDG_RUNTIME_DIR, if defined; otherwise, in a private folder in /tmp (created by the server) """
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return f'{runtime_dir}/fsel-{os.getuid()}.sock'
+    return f'/tmp/fsel-{os.getuid()}/fsel.sock'
+
+
+def is_private_folder(path: str) -> bool:
+    """ True if the folder belongs to this user, and nobody else can add or replace entries in it """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and st.st_mode & (stat.S_IWGRP | stat.S_IWOTH) == 0
+
+
+def is_trusted_socket(path: str) -> bool:
+    """ True if the socket belongs to this user, and lives in a private folder (so it cannot be planted by others) """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(st.st_mode) and st.st_uid == os.getuid() and is_private_folder(os.path.dirname(path))
+
+
+def peer_uid(s: socket.socket) -> int:
+    _, uid, _ = struct.unpack('3i', s.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    return uid
+
+
+def recv_exactly(s: socket.socket, length: int) -> bytes:
+    data = b''
+    while len(data) < length:
+        chunk = s.recv(length - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def main():
+    args = sys.argv[1:]
+    path = socket_path()
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if not is_trusted_socket(path):
+            raise ConnectionRefusedError(path)
+        s.connect(path)
+        # the terminal is passed only to a server, run by this user
+        if peer_uid(s) != os.getuid():
+            raise ConnectionRefusedError(path)
+    except OSError:
+        s.close()
+        os.execvp(sys.executable, [sys.executable, '-m', 'fsel.app', *args])
+
+    with s:
+        request = {'args': args, 'cwd': os.getcwd(), 'env': {'PWD': os.getenv('PWD') or os.getcwd()}}
+        socket.send_fds(s, [json.dumps(request).encode()], [0, 1, 2])
+        reply = recv_exactly(s, 4)
+    sys.exit(struct.unpack('!i', reply)[0] if len(reply) == 4 else 1)
+
+
+if __name__ == "__main__":
+    main()
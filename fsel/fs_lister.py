@@ -1,52 +1,137 @@
 import os
 import sys
-from typing import List, AnyStr, Sequence
+from stat import S_IXUSR, S_IXGRP, S_IXOTH
+from typing import List, AnyStr, Sequence, Iterator, Dict, Tuple, Optional
 
+from fsel.ignore_rules import IgnoreRules
 from fsel.lib.list_item import ListItem
+from fsel.lib.list_items import ListItems
 from fsel.lib.list_item_info_service import ListItemInfoService
 
 
+def folder_signature(full_fs_path: str) -> Optional[Tuple[int, int]]:
+    """ (st_mtime_ns, st_ino) of the folder, or None if it cannot be stat-ed """
+    try:
+        st = os.stat(full_fs_path)
+        return st.st_mtime_ns, st.st_ino
+    except OSError:
+        return None
+
+
 class FsListFiles:
-    def __init__(self, root: AnyStr, select_files: bool, executables: bool, dot_files):
+    DETAILS_CACHE_CAPACITY = 65536
+    # what to do with entries, matched by .gitignore/.ignore files (None: ignore files are not read)
+    IGNORED_HIDE = 'hide'
+    IGNORED_DIM = 'dim'
+
+    def __init__(self, root: AnyStr, select_files: bool, executables: bool, dot_files, ignored: Optional[str] = None):
         self.root = root
         self.select_files = select_files
         self.executables = executables
         self.dot_files = dot_files
+        self.ignored = ignored
+        self.ignore_rules = None if ignored is None else IgnoreRules(root)
+        self.details_cache: Dict[Tuple[int, int], Tuple[Optional[str], bool]] = {}
+        # effective ids of the process, for is_executable()
+        self.uid = os.geteuid()
+        self.gid = os.getegid()
+        self.groups = frozenset(os.getgroups()) if self.uid != 0 else frozenset()
+
+    def variant(self) -> str:
+        """ Short id of the listing options; listings made with different options are not interchangeable """
+        suffix = {None: '', FsListFiles.IGNORED_HIDE: 'i', FsListFiles.IGNORED_DIM: 'I'}[self.ignored]
+        if not self.select_files:
+            return 'd' + suffix
+        return 'f' + ('x' if self.executables else '') + ('a' if self.dot_files else '') + suffix
+
+    def signature(self, p: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        """
+        Changes, when the listing of the folder may change: folder_signature() of the folder,
+        followed by the signatures of the ignore files, that apply to it (editing them does not touch the folder)
+        """
+        signature = folder_signature(os.path.join(self.root, *p))
+        if signature is None or self.ignore_rules is None:
+            return signature
+        return signature + self.ignore_rules.files_signature(p)
 
     def __call__(self, p: Sequence[str]) -> Sequence[ListItem]:
-        """ Each item is a tuple; last element of tuple is int with item attributes (same as in st_mode) """
-        return self.list_folders(p) + self.list_files(p)
+        """ Sorted items, packed into ListItems; attributes of an item are those of st_mode, with ListItemInfoService flags """
+        return ListItems.pack(self.iter_entries(p))
+
+    def scan(self, p: Sequence[str], batch_size: int = 1000) -> Iterator[List[ListItem]]:
+        """ Yields unsorted batches of items, as they are discovered """
+        batch = []
+        for item in self.iter_entries(p):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        yield batch
 
-    def list_folders(self, path: Sequence[str]) -> List[ListItem]:
+    def iter_entries(self, path: Sequence[str]) -> Iterator[ListItem]:
+        """ Folders and (if selecting files) suitable files, in one pass over the folder """
         full_fs_path = os.path.join(self.root, *path)
         if full_fs_path == '':
             sys.exit(1)
+        is_ignored = None if self.ignore_rules is None else self.ignore_rules.checker(path)
         try:
-            result = []
-            # see DirEntry
+            # see DirEntry: is_dir() and is_file() are answered from d_type, without a syscall (unless a symlink)
             for entry in os.scandir(full_fs_path):
-                if entry.is_dir() and not entry.name.startswith('.'):
-                    st_mode = entry.stat().st_mode
-                    entry_path = os.path.join(full_fs_path, entry.name)
-                    description = self.get_description(entry_path)
-                    
-                    # Set flags based on attributes
-                    flags = st_mode | ListItemInfoService.FLAG_DIRECTORY
-                    if entry.is_symlink():
-                        flags |= ListItemInfoService.FLAG_ITALIC
-                    if self.is_deleted(entry_path):
-                        flags |= ListItemInfoService.FLAG_STRIKE_THRU
-                        
-                    result.append(
-                        ListItem(
-                            name=entry.name,
-                            attrs=flags,
-                            description=description,
-                        )
-                    )
-            return sorted(result, key=lambda e: e.name)
-        except PermissionError:
-            return []
+                if entry.is_dir():
+                    if entry.name.startswith('.'):
+                        continue
+                    ignored = is_ignored is not None and is_ignored(entry.name, True)
+                    if ignored and self.ignored != FsListFiles.IGNORED_DIM:
+                        continue
+                    try:
+                        item = self.folder_item(entry)
+                    except FileNotFoundError:  # removed while listing
+                        continue
+                    if ignored:
+                        item.attrs |= ListItemInfoService.FLAG_IGNORED
+                    yield item
+                elif self.select_files and self.is_suitable_file(entry):
+                    if is_ignored is None or not is_ignored(entry.name, False):
+                        yield ListItem(name=entry.name, attrs=0, description=None)
+                    elif self.ignored == FsListFiles.IGNORED_DIM:
+                        yield ListItem(name=entry.name, attrs=ListItemInfoService.FLAG_IGNORED, description=None)
+        except (PermissionError, FileNotFoundError, NotADirectoryError):  # the folder may have vanished
+            return
+
+    def folder_item(self, entry: os.DirEntry) -> ListItem:
+        st_mode = entry.stat().st_mode
+
+        # Set flags based on attributes;
+        # description and 'deleted' flag are resolved later, only for the items that get displayed
+        flags = st_mode | ListItemInfoService.FLAG_DIRECTORY | ListItemInfoService.FLAG_DETAILS_PENDING
+        if entry.is_symlink():
+            flags |= ListItemInfoService.FLAG_ITALIC
+
+        return ListItem(
+            name=entry.name,
+            attrs=flags,
+            description=None,
+        )
+
+    def resolve_details(self, path: Sequence[str], item: ListItem):
+        """ Resolve description and 'deleted' flag of the item from extended attributes (cached per inode and ctime) """
+        if not item.attrs & ListItemInfoService.FLAG_DETAILS_PENDING:
+            return
+        item.attrs &= ~ListItemInfoService.FLAG_DETAILS_PENDING
+        entry_path = os.path.join(self.root, *path, item.name)
+        try:
+            st = os.stat(entry_path)
+        except OSError:
+            return
+        key = st.st_ino, st.st_ctime_ns
+        details = self.details_cache.get(key)
+        if details is None:
+            if len(self.details_cache) >= FsListFiles.DETAILS_CACHE_CAPACITY:
+                self.details_cache.clear()
+            details = self.details_cache[key] = self.get_description(entry_path), self.is_deleted(entry_path)
+        item.description, is_deleted = details
+        if is_deleted:
+            item.attrs |= ListItemInfoService.FLAG_STRIKE_THRU
 
     def get_description(self, path: str):
         """Get the description from the 'user.description' extended attribute"""
@@ -63,21 +148,24 @@ class FsListFiles:
         except (OSError, AttributeError):
             return False
 
-    def list_files(self, p: Sequence[str]) -> List[ListItem]:
-        if not self.select_files:
-            return []
-        full_fs_path = os.path.join(self.root, *p)
+    def is_suitable_file(self, entry: os.DirEntry):
+        if not self.dot_files and entry.name.startswith('.'):
+            return False
         try:
-            name: List[str] = os.listdir(full_fs_path)
-            return [ListItem(name=entry, attrs=0, description=None) for entry in sorted(name) if self.is_suitable_file(full_fs_path, entry)]
-        except PermissionError:
-            return []
-
-    def is_suitable_file(self, folder, name):
-        return (self.dot_files or not name.startswith('.')) and self.is_suitable_file_path(folder + '/' + name)
-
-    def is_suitable_file_path(self, path):
-        is_file = os.path.isfile(path)
-        if not is_file: return False
-        if self.executables: return os.access(path, os.X_OK)
-        return True
+            if not entry.is_file():
+                return False
+            return not self.executables or self.is_executable(entry.stat())
+        except OSError:
+            return False
+
+    def is_executable(self, st: os.stat_result):
+        """ Same answer as os.access(path, os.X_OK), but from the (cached) stat of DirEntry """
+        if st.st_mode & (S_IXUSR | S_IXGRP | S_IXOTH) == 0:
+            return False
+        if self.uid == 0:
+            return True
+        if st.st_uid == self.uid:
+            return st.st_mode & S_IXUSR != 0
+        if st.st_gid == self.gid or st.st_gid in self.groups:
+            return st.st_mode & S_IXGRP != 0
+        return st.st_mode & S_IXOTH != 0
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Sequence, Optional, Tuple, Iterator, List
+
+from fsel.fs_lister import FsListFiles
+from fsel.lib.list_item import ListItem
+from fsel.lib.list_items import ListItems
+from fsel.lib.logging import debug
+
+
+class FsListingCache:
+    """
+    Bounded LRU cache of folder listings in front of FsListFiles.
+    An entry is valid while the folder's mtime and inode are unchanged (and the applicable ignore files, if read),
+    so a hit costs one stat() instead of scandir, stat() per entry and xattr lookups (see FsListFiles.signature()).
+    """
+    DEFAULT_CAPACITY = 256
+    # Folders, whose st_size exceeds this, are streamed (the size of a folder grows with the number of entries)
+    LARGE_FOLDER_SIZE = 256 * 1024
+
+    def __init__(self, delegate: FsListFiles, capacity: int = DEFAULT_CAPACITY):
+        self.delegate = delegate
+        self.root = delegate.root
+        self.capacity = capacity
+        self.entries: OrderedDict[Tuple[str, ...], Tuple[Tuple[int, ...], Sequence[ListItem]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, p: Sequence[str]) -> Sequence[ListItem]:
+        return self.list_with_signature(p)[1]
+
+    def signature(self, p: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        return self.delegate.signature(p)
+
+    def list_with_signature(self, p: Sequence[str]) -> Tuple[Optional[Tuple[int, ...]], Sequence[ListItem]]:
+        key = tuple(p)
+        signature = self.delegate.signature(p)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and signature is not None and cached[0] == signature:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return signature, cached[1]
+            self.misses += 1
+
+        items = self.delegate(p)
+        self.put(p, signature, items)
+        return signature, items
+
+    def stream(self, p: Sequence[str]) -> Optional[Iterator[List[ListItem]]]:
+        """ Batches of items of a large folder, that is not in the cache; None if the folder should be listed at once """
+        key = tuple(p)
+        try:
+            st = os.stat(os.path.join(self.root, *p))
+        except OSError:
+            return None
+        if st.st_size < FsListingCache.LARGE_FOLDER_SIZE:
+            return None
+        signature = self.delegate.signature(p)
+        with self.lock:
+            cached = self.entries.get(key)
+            if signature is None or cached is not None and cached[0] == signature:
+                return None
+        debug('FsListingCache.stream', path=p, size=st.st_size)
+        return self.scan_and_put(p, signature)
+
+    def scan_and_put(self, p: Sequence[str], signature: Tuple[int, ...]) -> Iterator[List[ListItem]]:
+        items = []
+        for batch in self.delegate.scan(p):
+            items.extend(batch)
+            yield batch
+        self.put(p, signature, ListItems.pack(items))
+
+    def put(self, p: Sequence[str], signature: Optional[Tuple[int, ...]], items: Sequence[ListItem]):
+        key = tuple(p)
+        with self.lock:
+            if signature is None:
+                self.entries.pop(key, None)
+                return
+            self.entries[key] = (signature, items)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, p: Sequence[str]):
+        with self.lock:
+            self.entries.pop(tuple(p), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def report(self):
+        debug('FsListingCache', hits=self.hits, misses=self.misses, size=len(self.entries))
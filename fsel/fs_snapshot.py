@@ -0,0 +1,196 @@
+import json
+import os
+import queue
+import threading
+from typing import Sequence, Dict, List, Optional, Tuple, Iterator, Set, Union
+
+from fsel.fs_listing_cache import FsListingCache
+from fsel.lib.list_item import ListItem
+from fsel.lib.list_item_info_service import ListItemInfoService
+from fsel.lib.list_items import ListItems
+from fsel.lib.logging import debug
+from fsel.lib.revalidations import Revalidations
+
+
+class FsSnapshot:
+    """
+    On-disk snapshot of folder listings under one root.
+    Each line holds the listing of a folder together with the signature it was captured at (see FsListFiles.signature()):
+    "a/b"<TAB>item count<TAB>[[mtime_ns, ino, ...], [[name, attrs], ...]]
+    Only the keys are parsed on load; the listing of a folder is parsed when it is requested.
+    Details of folders (description, 'deleted' flag) are not kept: they are resolved for the visible rows anyway.
+    """
+    MAX_ENTRIES = 1024
+    # Larger folders are not kept in the snapshot: they would make loading and saving of the snapshot slow
+    MAX_FOLDER_ITEMS = 2000
+    MAX_ITEMS = 50000
+
+    # key -> (item count, entry: parsed, or its JSON text, as loaded)
+    entries: Dict[str, Tuple[int, Union[List, str]]]
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        entries = {}
+        try:
+            with open(self.file_name) as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t', 2)
+                    if len(fields) == 3:
+                        entries[json.loads(fields[0])] = int(fields[1]), fields[2]
+        except (OSError, ValueError):
+            entries = {}
+        self.entries = entries
+        return self
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            # the most recently used entries, within the limits
+            entries = []
+            total_items = 0
+            for key, (count, entry) in reversed(self.entries.items()):
+                if len(entries) >= FsSnapshot.MAX_ENTRIES or total_items + count > FsSnapshot.MAX_ITEMS:
+                    break
+                entries.append((key, count, entry))
+                total_items += count
+        try:
+            os.makedirs(os.path.dirname(self.file_name), exist_ok=True)
+            tmp_file_name = self.file_name + '.tmp'
+            with open(tmp_file_name, 'w') as f:
+                for key, count, entry in reversed(entries):
+                    text = entry if isinstance(entry, str) else json.dumps(entry, separators=(',', ':'))
+                    f.write(f'{json.dumps(key)}\t{count}\t{text}\n')
+            os.replace(tmp_file_name, self.file_name)
+        except OSError as e:
+            debug('FsSnapshot.save', error=str(e))
+
+    def contains(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def entry(self, key: str) -> Optional[List]:
+        """ Parsed entry (parsed on first request); the lock is held """
+        count_and_entry = self.entries.get(key)
+        if count_and_entry is None:
+            return None
+        count, entry = count_and_entry
+        if isinstance(entry, str):
+            try:
+                entry = json.loads(entry)
+            except ValueError:
+                entry = None
+            if type(entry) is not list or len(entry) != 2:  # damaged, or of an older format
+                del self.entries[key]
+                return None
+            self.entries[key] = count, entry
+        return entry
+
+    def get(self, key: str) -> Optional[Tuple[Tuple[int, ...], Sequence[ListItem]]]:
+        with self.lock:
+            entry = self.entry(key)
+        if entry is None:
+            return None
+        signature, items = entry
+        return tuple(signature), ListItems.pack(
+            ListItem(name=name, attrs=attrs, description=None) for name, attrs in items
+        )
+
+    def put(self, key: str, signature: Optional[Tuple[int, ...]], items: Sequence[ListItem]):
+        with self.lock:
+            if signature is None or len(items) > FsSnapshot.MAX_FOLDER_ITEMS:
+                self.dirty |= self.entries.pop(key, None) is not None
+                return
+            entry = [list(signature), [[item.name, FsSnapshot.unresolved_attrs(item.attrs)] for item in items]]
+            if self.entry(key) != entry:
+                self.dirty = True
+            # re-insert, so that recently used entries survive truncation on save
+            self.entries.pop(key, None)
+            self.entries[key] = len(items), entry
+
+    @staticmethod
+    def unresolved_attrs(attrs: int) -> int:
+        """ Attributes of an item, as listed (before its details have been resolved) """
+        if attrs & ListItemInfoService.FLAG_DIRECTORY:
+            return (attrs & ~ListItemInfoService.FLAG_STRIKE_THRU) | ListItemInfoService.FLAG_DETAILS_PENDING
+        return attrs
+
+
+class SnapshotListFiles(Revalidations):
+    """
+    Serves the first listing of every folder from the snapshot, without touching the file system,
+    and revalidates it in the background against the folder's signature (mtime, inode, applicable ignore files).
+    Once revalidated, the folder is listed through the (warmed up) listing cache;
+    folders, whose snapshot was out of date, are reported by changed_folders(), so that their boxes are refreshed.
+    """
+
+    def __init__(self, delegate: FsListingCache, snapshot: FsSnapshot):
+        self.delegate = delegate
+        self.root = delegate.root
+        self.snapshot = snapshot
+        self.revalidated = set()
+        self.pending = queue.Queue()
+        self.stale: Set[Tuple[str, ...]] = set()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def __call__(self, p: Sequence[str]) -> Sequence[ListItem]:
+        key = '/'.join(p)
+        if key not in self.revalidated:
+            snapshot_entry = self.snapshot.get(key)
+            if snapshot_entry is not None:
+                self.revalidated.add(key)
+                self.revalidate_in_background(list(p), snapshot_entry)
+                return snapshot_entry[1]
+
+        signature, items = self.delegate.list_with_signature(p)
+        self.revalidated.add(key)
+        self.snapshot.put(key, signature, items)
+        return items
+
+    def signature(self, p: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        return self.delegate.signature(p)
+
+    def stream(self, p: Sequence[str]) -> Optional[Iterator[List[ListItem]]]:
+        """ Large folders are streamed straight from the file system, and are not kept in the snapshot """
+        key = '/'.join(p)
+        if key not in self.revalidated and self.snapshot.contains(key):
+            return None
+        self.revalidated.add(key)
+        return self.delegate.stream(p)
+
+    def revalidate_in_background(self, p: List[str], snapshot_entry):
+        self.pending.put((p, snapshot_entry))
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.revalidate_pending, daemon=True)
+            self.worker.start()
+
+    def revalidate_pending(self):
+        while True:
+            p, (snapshot_signature, items) = self.pending.get()
+            try:
+                signature = self.delegate.signature(p)
+                if signature == snapshot_signature:
+                    self.delegate.put(p, signature, items)
+                else:
+                    debug('SnapshotListFiles.revalidate_pending', path=p, stale=True)
+                    signature, items = self.delegate.list_with_signature(p)
+                    self.snapshot.put('/'.join(p), signature, items)
+                    with self.lock:
+                        self.stale.add(tuple(p))
+            finally:
+                self.pending.task_done()
+
+    def is_pending(self) -> bool:
+        with self.lock:
+            return self.pending.unfinished_tasks > 0 or len(self.stale) > 0
+
+    def changed_folders(self) -> Set[Tuple[str, ...]]:
+        with self.lock:
+            stale, self.stale = self.stale, set()
+        return stale
@@ -0,0 +1,162 @@
+import mmap
+import os
+import stat
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from fsel.lib.logging import debug
+
+GITLINK_MODE = 0o160000
+
+
+def find_work_tree(path: str) -> Optional[str]:
+    """ The nearest folder (the path or its ancestor), that contains .git; None if there is none """
+    work_tree = path
+    while not os.path.exists(os.path.join(work_tree, '.git')):
+        parent = os.path.dirname(work_tree)
+        if parent == work_tree:
+            return None
+        work_tree = parent
+    return work_tree
+
+
+def index_file_of(work_tree: str) -> Optional[str]:
+    """ Path of the index file of the work tree (that may be linked, with .git file, holding "gitdir: <path>") """
+    git_dir = os.path.join(work_tree, '.git')
+    if os.path.isfile(git_dir):
+        try:
+            with open(git_dir) as f:
+                content = f.read().strip()
+        except OSError:
+            return None
+        if not content.startswith('gitdir:'):
+            return None
+        git_dir = os.path.join(work_tree, content[len('gitdir:'):].strip())
+    return os.path.join(git_dir, 'index')
+
+
+class GitIndexFolder:
+    """ Tracked entries of one folder: names of sub-folders, and (name, mode) of files """
+    __slots__ = ('folders', 'files')
+
+    def __init__(self):
+        self.folders: List[str] = []
+        self.files: List[Tuple[str, int]] = []
+
+
+class GitIndex:
+    """
+    Tree of the paths, tracked in a git repository, read from its index file (.git/index, versions 2 to 4).
+    The file is mapped into memory and parsed once; refresh() re-reads it only if its mtime or size has changed.
+    Submodules (gitlinks) and sparse directory entries are represented as folders, whose contents are not known.
+    """
+    HEADER = struct.Struct('>4sII')
+    ENTRY_MODE = struct.Struct('>I')
+    ENTRY_FLAGS = struct.Struct('>H')
+    # ctime, mtime (8 bytes each), dev, ino, mode, uid, gid, size (4 bytes each), object id (20 bytes)
+    MODE_OFFSET = 24
+    FLAGS_OFFSET = 60
+    FLAG_EXTENDED = 0x4000
+
+    def __init__(self, work_tree: str, index_file: str):
+        self.work_tree = work_tree
+        self.index_file = index_file
+        self.signature = None
+        self.folders: Dict[str, GitIndexFolder] = {}
+
+    @staticmethod
+    def for_path(path: str) -> Optional['GitIndex']:
+        """ The index of the repository, whose work tree contains the path; None if there is none """
+        work_tree = find_work_tree(path)
+        if work_tree is None:
+            return None
+
+        index_file = index_file_of(work_tree)
+        if index_file is None or not os.path.isfile(index_file):
+            return None
+        index = GitIndex(work_tree, index_file)
+        return index if index.refresh() else None
+
+    def refresh(self) -> bool:
+        """ Re-read the index, if it has changed; False if it cannot be read """
+        try:
+            st = os.stat(self.index_file)
+        except OSError:
+            return False
+        signature = st.st_mtime_ns, st.st_size
+        if signature == self.signature:
+            return True
+        try:
+            with open(self.index_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.folders = GitIndex.build_tree(GitIndex.parse(data))
+        except (OSError, ValueError, struct.error) as e:
+            debug('GitIndex.refresh', index_file=self.index_file, error=str(e))
+            return False
+        self.signature = signature
+        debug('GitIndex.refresh', index_file=self.index_file, folders=len(self.folders))
+        return True
+
+    @staticmethod
+    def parse(data) -> List[Tuple[str, int]]:
+        """ (path, mode) of the entries, in the order of the index (sorted by path); conflict stages are collapsed """
+        signature, version, count = GitIndex.HEADER.unpack_from(data, 0)
+        if signature != b'DIRC' or version not in (2, 3, 4):
+            raise ValueError(f'unsupported index: {signature!r} version {version}')
+
+        entries = []
+        offset = GitIndex.HEADER.size
+        previous_name = b''
+        mode_of, flags_of = GitIndex.ENTRY_MODE.unpack_from, GitIndex.ENTRY_FLAGS.unpack_from
+        for _ in range(count):
+            flags = flags_of(data, offset + GitIndex.FLAGS_OFFSET)[0]
+            name_offset = offset + GitIndex.FLAGS_OFFSET + (4 if flags & GitIndex.FLAG_EXTENDED else 2)
+            if version == 4:
+                # name is prefix-compressed: number of bytes to strip from the previous name, then the rest
+                byte = data[name_offset]
+                name_offset += 1
+                strip = byte & 0x7F
+                while byte & 0x80:
+                    byte = data[name_offset]
+                    name_offset += 1
+                    strip = ((strip + 1) << 7) | (byte & 0x7F)
+                end = data.find(b'\0', name_offset)
+                name = previous_name[:len(previous_name) - strip] + data[name_offset:end]
+                next_offset = end + 1
+            else:
+                end = data.find(b'\0', name_offset)
+                name = data[name_offset:end]
+                # entries are padded with 1 to 8 NUL bytes to a multiple of 8 bytes
+                next_offset = offset + ((end - offset + 8) & ~7)
+
+            if name != previous_name:
+                entries.append((name, mode_of(data, offset + GitIndex.MODE_OFFSET)[0]))
+            previous_name = name
+            offset = next_offset
+        return [(name.decode('utf-8', 'surrogateescape'), mode) for name, mode in entries]
+
+    @staticmethod
+    def build_tree(entries: List[Tuple[str, int]]) -> Dict[str, GitIndexFolder]:
+        folders = {'': GitIndexFolder()}
+        for path, mode in entries:
+            path = path.rstrip('/')  # sparse directory entries end with '/'
+            folder_path, _, name = path.rpartition('/')
+            folder = folders.get(folder_path)
+            if folder is None:
+                folder = GitIndex.add_folder(folders, folder_path)
+            if mode == GITLINK_MODE or stat.S_ISDIR(mode):
+                # contents of submodules and of sparse directories are not in this index: no GitIndexFolder for them
+                folder.folders.append(name)
+            else:
+                folder.files.append((name, mode))
+        return folders
+
+    @staticmethod
+    def add_folder(folders: Dict[str, GitIndexFolder], path: str) -> GitIndexFolder:
+        """ Adds the folder, and those of its ancestors, that are not there yet """
+        folder = folders[path] = GitIndexFolder()
+        parent_path, _, name = path.rpartition('/')
+        parent = folders.get(parent_path)
+        if parent is None:
+            parent = GitIndex.add_folder(folders, parent_path)
+        parent.folders.append(name)
+        return folder
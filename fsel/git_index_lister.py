@@ -0,0 +1,90 @@
+import os
+import stat
+from typing import Iterator, List, Optional, Sequence, AnyStr
+
+from fsel.fs_lister import FsListFiles
+from fsel.git_index import GitIndex
+from fsel.lib.list_item import ListItem
+from fsel.lib.list_item_info_service import ListItemInfoService, list_item_info_service
+
+
+class GitIndexListFiles(FsListFiles):
+    """
+    Lists the paths, tracked in the git index, without touching the file system.
+    Folders, that are not in the index (e.g. untracked, or submodules), are listed from the file system;
+    with untracked=True, untracked entries of tracked folders are listed from the file system, too.
+    Tracked symlinks are resolved: symlinked folders are listed as folders (in italic), like FsListFiles does.
+    """
+    FOLDER_ATTRS = stat.S_IFDIR | 0o755 | ListItemInfoService.FLAG_DIRECTORY | ListItemInfoService.FLAG_DETAILS_PENDING
+
+    def __init__(self, git_index: GitIndex, root: AnyStr, select_files: bool, executables: bool, dot_files,
+                 ignored: Optional[str] = None, untracked: bool = False):
+        super().__init__(root, select_files, executables, dot_files, ignored)
+        self.git_index = git_index
+        self.untracked = untracked
+        # path of the root in the work tree
+        rel_root = os.path.relpath(root, git_index.work_tree)
+        self.prefix = [] if rel_root == '.' else rel_root.split('/')
+
+    def variant(self) -> str:
+        return super().variant() + ('G' if not self.untracked else 'Gu')
+
+    def stream(self, p: Sequence[str]) -> Optional[Iterator[List[ListItem]]]:
+        """ Listings come from memory: never streamed """
+        return None
+
+    def iter_entries(self, path: Sequence[str]) -> Iterator[ListItem]:
+        folder = self.git_index.folders.get('/'.join([*self.prefix, *path]))
+        if folder is None:
+            yield from super().iter_entries(path)
+            return
+
+        is_ignored = None if self.ignore_rules is None else self.ignore_rules.checker(path)
+        for name in folder.folders:
+            if name.startswith('.'):
+                continue
+            item = ListItem(name=name, attrs=GitIndexListFiles.FOLDER_ATTRS, description=None)
+            if is_ignored is None or not is_ignored(name, True):
+                yield item
+            elif self.ignored == FsListFiles.IGNORED_DIM:
+                item.attrs |= ListItemInfoService.FLAG_IGNORED
+                yield item
+        for name, mode in folder.files:
+            if stat.S_ISLNK(mode):
+                item = self.symlink_item(path, name)
+                if item is None:
+                    continue
+            elif not self.select_files or not self.dot_files and name.startswith('.') \
+                    or self.executables and not mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+                continue
+            else:
+                item = ListItem(name=name, attrs=0, description=None)
+            if is_ignored is None or not is_ignored(name, not list_item_info_service.is_leaf(item)):
+                yield item
+            elif self.ignored == FsListFiles.IGNORED_DIM:
+                item.attrs |= ListItemInfoService.FLAG_IGNORED
+                yield item
+
+        if self.untracked:
+            tracked = set(folder.folders)
+            tracked.update(name for name, _ in folder.files)
+            for item in super().iter_entries(path):
+                if item.name not in tracked:
+                    yield item
+
+    def symlink_item(self, path: Sequence[str], name: str) -> Optional[ListItem]:
+        """ Tracked symlink, listed as FsListFiles lists it (by its target); None if it is not listed """
+        try:
+            st = os.stat(os.path.join(self.root, *path, name))
+        except OSError:  # dangling
+            return None
+        if stat.S_ISDIR(st.st_mode):
+            if name.startswith('.'):
+                return None
+            flags = ListItemInfoService.FLAG_DIRECTORY | ListItemInfoService.FLAG_DETAILS_PENDING \
+                | ListItemInfoService.FLAG_ITALIC
+            return ListItem(name=name, attrs=st.st_mode | flags, description=None)
+        if not self.select_files or not stat.S_ISREG(st.st_mode) or not self.dot_files and name.startswith('.') \
+                or self.executables and not self.is_executable(st):
+            return None
+        return ListItem(name=name, attrs=0, description=None)
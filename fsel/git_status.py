@@ -0,0 +1,134 @@
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Optional, Tuple, Sequence, Callable
+
+from fsel.git_index import find_work_tree, index_file_of
+from fsel.lib.decorations import Decorations
+from fsel.lib.list_item_info_service import ListItemInfoService
+from fsel.lib.logging import debug
+
+
+class GitStatus(Decorations):
+    """
+    States of the changed, untracked and ignored paths of a git work tree, as ListItemInfoService.FLAG_GIT_* flags,
+    from one background `git status --porcelain -z`.
+    Modified and untracked states are aggregated up to the folders, that contain such paths;
+    folders, that are untracked or ignored as a whole, pass their state down to everything inside.
+    Results are kept until the mtime of the index or of the top folder of the work tree changes
+    (or they get older than MAX_AGE); until they are available, nothing is decorated.
+    """
+    MAX_AGE = 30
+
+    states: Dict[str, int]
+    whole_folder_states: Dict[str, int]
+
+    def __init__(self, work_tree: str):
+        self.work_tree = work_tree
+        self.index_file = index_file_of(work_tree)
+        self.states = {}
+        self.whole_folder_states = {}
+        self.signature = None
+        self.checked_at = 0.0
+        self.version = 0  # incremented, when new results are available
+        self.lock = threading.Lock()  # held while new results are stored
+        self.worker = None
+
+    @staticmethod
+    def for_path(path: str) -> Optional['GitStatus']:
+        work_tree = find_work_tree(path)
+        return None if work_tree is None else GitStatus(work_tree)
+
+    def current_signature(self) -> Tuple:
+        signatures = []
+        for path in (self.index_file, self.work_tree):
+            try:
+                signatures.append(os.stat(path).st_mtime_ns)
+            except (OSError, TypeError):
+                signatures.append(None)
+        return tuple(signatures)
+
+    def refresh_in_background(self):
+        """ Start `git status`, unless the results are up to date, or it is running already """
+        if self.is_pending():
+            return
+        signature = self.current_signature()
+        if signature == self.signature and time.time() - self.checked_at < GitStatus.MAX_AGE:
+            return
+        self.worker = threading.Thread(target=self.refresh, args=(signature,), daemon=True)
+        self.worker.start()
+
+    def is_pending(self) -> bool:
+        return self.worker is not None and self.worker.is_alive()
+
+    def refresh(self, signature: Tuple):
+        started = time.time()
+        try:
+            output = subprocess.run(
+                ['git', '--no-optional-locks', 'status', '--porcelain', '-z', '--ignored', '--untracked-files=normal'],
+                cwd=self.work_tree, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            ).stdout
+        except OSError as e:
+            debug('GitStatus.refresh', error=str(e))
+            return
+        states, whole_folder_states = GitStatus.parse(output)
+        with self.lock:
+            self.states, self.whole_folder_states = states, whole_folder_states
+            self.signature = signature
+            self.checked_at = time.time()
+            self.version += 1
+        debug('GitStatus.refresh', work_tree=self.work_tree, paths=len(states), seconds=time.time() - started)
+
+    @staticmethod
+    def parse(output: bytes) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """ States of paths (with the states of their ancestors), and states of untracked and ignored folders """
+        states = {}
+        whole_folder_states = {}
+        records = output.split(b'\0')
+        i = 0
+        while i < len(records):
+            record = records[i]
+            i += 1
+            if len(record) < 4:
+                continue
+            code, path = record[:2], record[3:].decode('utf-8', 'surrogateescape')
+            if code[0:1] in b'RC':
+                i += 1  # the original path of renamed or copied entry follows
+            if code == b'!!':
+                flag = ListItemInfoService.FLAG_GIT_IGNORED
+            elif code == b'??':
+                flag = ListItemInfoService.FLAG_GIT_UNTRACKED
+            else:
+                flag = ListItemInfoService.FLAG_GIT_MODIFIED
+            if path.endswith('/'):
+                path = path[:-1]
+                whole_folder_states[path] = flag
+            states[path] = states.get(path, 0) | flag
+            if flag == ListItemInfoService.FLAG_GIT_IGNORED:
+                continue  # a folder is not ignored, if some of its entries are
+            while '/' in path:
+                path = path.rpartition('/')[0]
+                if states.get(path, 0) & flag:
+                    break
+                states[path] = states.get(path, 0) | flag
+        return states, whole_folder_states
+
+    def state(self, path: str) -> int:
+        """ FLAG_GIT_* flags of the path, relative to the work tree """
+        flags = self.states.get(path)
+        if flags is not None:
+            return flags
+        if self.whole_folder_states:
+            while '/' in path:
+                path = path.rpartition('/')[0]
+                flags = self.whole_folder_states.get(path)
+                if flags is not None:
+                    return flags
+        return 0
+
+    def decorator(self, root: str) -> Callable[[Sequence[str], str], int]:
+        """ Function of (folder path, relative to root; entry name), returning FLAG_GIT_* flags of the entry """
+        rel_root = os.path.relpath(root, self.work_tree)
+        prefix = '' if rel_root == '.' else rel_root + '/'
+        return lambda folder, name: self.state(prefix + '/'.join([*folder, name]))
@@ -0,0 +1,190 @@
+import os
+import re
+from typing import Optional, List, Tuple, Dict, Sequence, Callable
+
+IGNORE_FILE_NAMES = ('.gitignore', '.ignore')
+
+
+def pattern_regex(pattern: str) -> str:
+    """ Regular expression for a gitignore pattern (without '!' and trailing '/'), matched against a relative path """
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    result = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            result.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            result.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            result.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            char_class = pattern[i + 1:end]
+            if char_class.startswith('!'):
+                char_class = '^' + char_class[1:]
+            result.append('[' + char_class.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            result.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            result.append(re.escape(pattern[i]))
+            i += 1
+    return ('' if anchored else '(?:.*/)?') + ''.join(result) + '$'
+
+
+class IgnoreMatcher:
+    """
+    Compiled patterns of the ignore files of one folder; the last matching pattern decides.
+    Without negated patterns, all patterns are combined into one regular expression (one more for folder-only patterns).
+    """
+    rules: List[Tuple[re.Pattern, bool, bool]]  # (regex, negated, folders only)
+
+    def __init__(self, lines: Sequence[str]):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\n')
+            if not line.endswith('\\ '):
+                line = line.rstrip(' ')
+            if line == '' or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            folders_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line:
+                self.rules.append((pattern_regex(line), negated, folders_only))
+
+        self.combined = None
+        if not any(negated for _, negated, _ in self.rules):
+            self.combined = (
+                IgnoreMatcher.compile_any([regex for regex, _, folders_only in self.rules if not folders_only]),
+                IgnoreMatcher.compile_any([regex for regex, _, folders_only in self.rules if folders_only]),
+            )
+        self.rules = [(re.compile(regex), negated, folders_only) for regex, negated, folders_only in self.rules]
+
+    @staticmethod
+    def compile_any(regexes: List[str]) -> Optional[re.Pattern]:
+        return re.compile('|'.join(f'(?:{regex})' for regex in regexes)) if regexes else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """ True if ignored, False if explicitly not ignored (negated pattern), None if no pattern matches """
+        if self.combined is not None:
+            any_regex, folders_regex = self.combined
+            if any_regex is not None and any_regex.match(rel_path) \
+                    or is_dir and folders_regex is not None and folders_regex.match(rel_path):
+                return True
+            return None
+        for regex, negated, folders_only in reversed(self.rules):
+            if folders_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negated
+        return None
+
+
+class IgnoreRules:
+    """
+    Ignore files (.gitignore, .ignore) of the folders under the root.
+    The files of every folder are compiled into an IgnoreMatcher once, and re-read only when they have changed
+    (checked for the folder and its ancestors, when the folder is listed).
+    Files in deeper folders override files in their ancestors.
+    """
+    matchers: Dict[str, Tuple[Tuple, Optional[IgnoreMatcher]]]
+
+    def __init__(self, root: str):
+        self.root = root
+        self.matchers = {}
+        self.ignored_folders: Dict[str, bool] = {}
+
+    def matcher(self, folder: Sequence[str], revalidate: bool = False) -> Optional[IgnoreMatcher]:
+        key = '/'.join(folder)
+        cached = self.matchers.get(key)
+        if cached is not None and not revalidate:
+            return cached[1]
+
+        file_names = [os.path.join(self.root, *folder, file_name) for file_name in IGNORE_FILE_NAMES]
+        signature = tuple(IgnoreRules.file_signature(file_name) for file_name in file_names)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        lines = []
+        for file_name, file_signature in zip(file_names, signature):
+            if file_signature is not None:
+                try:
+                    with open(file_name, errors='replace') as f:
+                        lines += f.readlines()
+                except OSError:
+                    pass
+        matcher = IgnoreMatcher(lines) if lines else None
+        self.matchers[key] = signature, matcher
+        if cached is not None:
+            self.ignored_folders.clear()  # rules have changed
+        return matcher
+
+    @staticmethod
+    def file_signature(file_name: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(file_name)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def files_signature(self, folder: Sequence[str]) -> Tuple[int, ...]:
+        """ (mtime, size) of the ignore files of the folder and of its ancestors, in one tuple; (0, -1) if missing """
+        signature = ()
+        for depth in range(len(folder) + 1):
+            for file_name in IGNORE_FILE_NAMES:
+                signature += IgnoreRules.file_signature(os.path.join(self.root, *folder[:depth], file_name)) or (0, -1)
+        return signature
+
+    def is_ignored(self, path: Sequence[str], is_dir: bool) -> bool:
+        """ path: of an entry, relative to the root """
+        for depth in range(len(path) - 1, -1, -1):
+            matcher = self.matcher(path[:depth])
+            if matcher is not None:
+                ignored = matcher.match('/'.join(path[depth:]), is_dir)
+                if ignored is not None:
+                    return ignored
+        return False
+
+    def is_ignored_folder(self, folder: Sequence[str]) -> bool:
+        """ True if the folder, or any of its ancestors, is ignored """
+        if len(folder) == 0:
+            return False
+        key = '/'.join(folder)
+        ignored = self.ignored_folders.get(key)
+        if ignored is None:
+            ignored = self.ignored_folders[key] = self.is_ignored_folder(folder[:-1]) or self.is_ignored(folder, True)
+        return ignored
+
+    def checker(self, folder: Sequence[str]) -> Optional[Callable[[str, bool], bool]]:
+        """ Function, telling whether an entry of the folder (name, is_dir) is ignored; None if nothing is ignored """
+        for depth in range(len(folder) + 1):
+            self.matcher(folder[:depth], True)
+        if self.is_ignored_folder(folder):
+            return lambda name, is_dir: True
+
+        matchers = [(depth, self.matcher(folder[:depth])) for depth in range(len(folder), -1, -1)]
+        matchers = [(depth, matcher) for depth, matcher in matchers if matcher is not None]
+        if not matchers:
+            return None
+
+        prefixes = ['/'.join(folder[depth:]) for depth, _ in matchers]
+
+        def is_ignored(name: str, is_dir: bool) -> bool:
+            for (_, matcher), prefix in zip(matchers, prefixes):
+                ignored = matcher.match(prefix + '/' + name if prefix else name, is_dir)
+                if ignored is not None:
+                    return ignored
+            return False
+
+        return is_ignored
@@ -1,27 +1,43 @@
-from typing import Sequence
+import bisect
+from typing import Sequence, Callable, Optional, List, Tuple, Set, Dict
 
 from picotui.widgets import WListBox
 
 from fsel.lib.list_item_info_service import list_item_info_service
 from fsel.lib.tui.paint_context import p_ctx
-from fsel.lib.tui.rich_text import RichText, rich_text_length, rich_text_to_plain
+from fsel.lib.tui.rich_text import RichText, rich_text_length
 from .list_item import ListItem
-from .logging import debug
+from .list_items import ListItemsView, estimated_max_text_length
+from .search_index import SearchIndex
 from fsel.lib.style_combiner import StyleCombiner
 from .tui.attribute import Attribute
 
 
 class CustomListBox(WListBox):
+    ROW_CACHE_SIZE = 1024
+
     def __init__(self, w, h, items: Sequence[ListItem], folder=None, search_string_supplier=lambda: '',
-                 is_full_match_supplier=lambda: True):
+                 is_full_match_supplier=lambda: True,
+                 details_resolver: Optional[Callable[[Sequence[str], ListItem], None]] = None,
+                 fuzzy: bool = False, decorator: Optional[Callable[[Sequence[str], str], int]] = None):
         super().__init__(w, h, items)
         self.folder = folder
         self.match_string_supplier = search_string_supplier
         self.is_full_match_supplier = is_full_match_supplier
+        self.details_resolver = details_resolver
+        self.decorator = decorator  # (folder, name) -> extra attribute flags, e.g. git status
         self.all_items = items
+        self.search_index = SearchIndex(items, fuzzy)
+        self.item_indices: Optional[List[int]] = None  # indices in all_items of the shown items; None if all are shown
+        self.match_rows: Optional[Tuple[str, Sequence[int]]] = None
+        self.scan = None
+        self.pending_name: Optional[str] = None  # name to select, when it arrives from the streaming scan
+        # index in all_items -> (item, (name, description, attrs, focused row), styled rich text, its length)
+        self.row_cache: Dict[int, Tuple[ListItem, Tuple, RichText, int]] = {}
+        self.row_cache_state = None  # (match string, full match, focused list, width) of the cached rows
 
     def __repr__(self):
-        return f'{self.folder}: {self.items[self.cur_line]} [focused:{self.focus}]'
+        return f'{self.folder}: {self.items[self.cur_line] if self.items else None} [focused:{self.focus}]'
 
     def make_cur_line_visible(self):
         overshoot = self.cur_line - (self.top_line + self.height)
@@ -32,6 +48,20 @@ class CustomListBox(WListBox):
             self.top_line -= undershoot
         self.top_line = max(self.top_line, 0)  # becomes negative when search-filtering?
 
+    def resolve_details(self, item: ListItem) -> bool:
+        """ True if details of the item have been resolved just now """
+        if self.details_resolver is not None and list_item_info_service.is_details_pending(item):
+            self.details_resolver(self.folder, item)
+            return True
+        return False
+
+    def resolve_viewport(self):
+        """ Resolve details of the visible items; the box may get wider (the width of a long list is estimated) """
+        for i in range(self.top_line, min(self.top_line + self.height, len(self.items))):
+            item = self.items[i]
+            self.resolve_details(item)
+            self.width = self.w = max(self.width, list_item_info_service.item_text_length(item))
+
     @staticmethod
     def goto(x, y):
         p_ctx.goto(x, y)
@@ -43,17 +73,39 @@ class CustomListBox(WListBox):
             p_ctx.clear_num_pos(self.width)
             p_ctx.attr_reset()
         else:
-            self.show_real_line(item, self.cur_line == i)
+            self.resolve_details(item)  # the box will be widened on the next layout, if needed
+            self.show_real_line(item, self.cur_line == i, i if self.item_indices is None else self.item_indices[i])
+
+    def show_real_line(self, item: ListItem, is_focused_item: bool, index: int):
+        """ index: index of the item in all_items """
+        styled_rich_text, visible_length = self.row_rich_text(item, is_focused_item, index)
+        p_ctx.paint_rich_text(styled_rich_text)
+        # Clear the rest of the line
+        p_ctx.clear_num_pos(self.width - visible_length)
+        p_ctx.attr_reset()
+
+    def row_rich_text(self, item: ListItem, is_focused_item: bool, index: int) -> Tuple[RichText, int]:
+        """
+        Styled rich text of the row, and its visible length.
+        Cached per row, while the match string, the focus of the list and the width stay the same
+        """
+        match_string = self.match_string_supplier()
+        state = (match_string, bool(match_string) and self.is_full_match_supplier(), self.focus, self.width)
+        if state != self.row_cache_state or len(self.row_cache) > CustomListBox.ROW_CACHE_SIZE:
+            self.row_cache.clear()
+            self.row_cache_state = state
 
-    def show_real_line(self, item: ListItem, is_focused_item: bool):
-        """Alternative implementation of show_real_line using RichText"""
-        # Get the rich text representation of the item
-        rich_text = list_item_info_service.item_rich_text(item)
         item_attrs = list_item_info_service.attrs(item)
+        if self.decorator is not None:
+            item_attrs |= self.decorator(self.folder, list_item_info_service.item_file_name(item))
+        key = (item.name, item.description, item_attrs, is_focused_item)
+        cached = self.row_cache.get(index)
+        if cached is not None and cached[0] is item and cached[1] == key:
+            return cached[2], cached[3]
 
         # Get palette for this item
-        combiner = StyleCombiner(attrs=item_attrs, focused_list=self.focus, focused_entry=is_focused_item)
-        
+        combiner = StyleCombiner.of(attrs=item_attrs, focused_list=self.focus, focused_entry=is_focused_item)
+
         # Create base style attributes
         base_attr = 0
         if list_item_info_service.is_italic(item):
@@ -62,105 +114,162 @@ class CustomListBox(WListBox):
             base_attr |= Attribute.MASK_CROSSED_OUT
 
         # Apply palette colors and attributes to each span in the rich text
-        styled_rich_text: RichText = []
-        for text, style in rich_text:
-            # Create a new style that combines the original style with our palette colors
-            new_style = combiner.style_for(base_attr, style)
-            styled_rich_text.append((text, new_style))
-        
+        styled_rich_text: RichText = [
+            (text, combiner.style_for(base_attr, style)) for text, style in list_item_info_service.item_rich_text(item)
+        ]
+
         # Handle search highlighting if needed
-        match_string = self.match_string_supplier()
-        if match_string and len(match_string) > 0:
-            # Convert rich text to plain text for searching
-            plain_text = rich_text_to_plain(styled_rich_text)
-            
-            # Find match in plain text
-            match_from = plain_text.find(match_string)
-            if match_from >= 0:
-                match_to = match_from + len(match_string)
-                
-                # Limit to width if needed
-                plain_text = plain_text[:self.width]
-                match_from = min(match_from, self.width)
-                match_to = min(match_to, self.width)
-                
-                debug('show_real_line2', width=self.width, plain_text=plain_text, 
-                      match_from=match_from, match_to=match_to)
-                
-                # Create a new rich text with highlighting for the match
-                highlighted_rich_text: RichText = []
-                current_pos = 0
-                
-                for text, style in styled_rich_text:
-                    text_start = current_pos
-                    text_end = text_start + len(text)
-                    
-                    # Check if this span overlaps with the match
-                    if text_end > match_from and text_start < match_to:
-                        # Calculate the overlap
-                        overlap_start = max(text_start, match_from) - text_start
-                        overlap_end = min(text_end, match_to) - text_start
-                        
-                        # Add text before match if any
-                        if overlap_start > 0:
-                            highlighted_rich_text.append((text[:overlap_start], style))
-                        
-                        # Add matched text with reversed style
-                        match_text = text[overlap_start:overlap_end]
-                        match_style = combiner.match_style_for(style)
+        if match_string:
+            positions = {p for p in self.search_index.positions(match_string, index) if p < self.width}
+            if positions:
+                match_attr = 0 if state[1] else Attribute.MASK_CROSSED_OUT
+                styled_rich_text = CustomListBox.highlighted(styled_rich_text, positions, combiner, match_attr)
 
-                        # Add crossed out attribute if not a full match
-                        full_match = self.is_full_match_supplier()
-                        if not full_match:
-                            match_style = match_style.with_attr_flag(Attribute.MASK_CROSSED_OUT)
-                        
-                        highlighted_rich_text.append((match_text, match_style))
-                        
-                        # Add text after match if any
-                        if overlap_end < len(text):
-                            highlighted_rich_text.append((text[overlap_end:], style))
-                    else:
-                        # This span doesn't overlap with the match
-                        highlighted_rich_text.append((text, style))
-                    
-                    current_pos = text_end
-                
-                # Use the highlighted rich text
-                styled_rich_text = highlighted_rich_text
-        
-        # Render the RichText
-        p_ctx.paint_rich_text(styled_rich_text)
-        
-        # Calculate total visible length of the rich text
         visible_length = rich_text_length(styled_rich_text)
-        
-        # Clear the rest of the line
-        p_ctx.clear_num_pos(self.width - visible_length)
-        p_ctx.attr_reset()
+        if visible_length > self.width:  # wider than estimated; the box is widened on the next layout
+            styled_rich_text = CustomListBox.clipped(styled_rich_text, self.width)
+            visible_length = self.width
+        self.row_cache[index] = item, key, styled_rich_text, visible_length
+        return styled_rich_text, visible_length
+
+    @staticmethod
+    def highlighted(rich_text: RichText, positions: Set[int], combiner: StyleCombiner, match_attr: int) -> RichText:
+        """ Rich text with the characters at positions in the match style (with match_attr added) """
+        result: RichText = []
+        offset = 0
+        for text, style in rich_text:
+            match_style = None
+            run_start = 0
+            for j in range(1, len(text) + 1):
+                if j < len(text) and ((offset + j) in positions) == ((offset + run_start) in positions):
+                    continue
+                if (offset + run_start) in positions:
+                    if match_style is None:
+                        match_style = combiner.match_style_for(style)
+                        if match_attr:
+                            match_style = match_style.with_attr_flag(match_attr)
+                    result.append((text[run_start:j], match_style))
+                else:
+                    result.append((text[run_start:j], style))
+                run_start = j
+            offset += len(text)
+        return result
+
+    @staticmethod
+    def clipped(rich_text: RichText, length: int) -> RichText:
+        result: RichText = []
+        for text, style in rich_text:
+            if length <= 0:
+                break
+            result.append((text[:length], style))
+            length -= len(text)
+        return result
 
     def handle_cursor_keys(self, key):
+        self.pending_name = None  # chosen by the user
         result = super().handle_cursor_keys(key)
         self.make_cur_line_visible()
         self.redraw()
         return result
 
-    def search(self, s: str):
-        content = []
-        cur_item = self.items[self.cur_line]
-        new_current_line = 0
-        found = False
-
-        for i, item in enumerate(self.all_items):
-            debug('CustomListBox.search', s=s, i=i, item_file_name=list_item_info_service.item_file_name(item))
-            is_current = item == cur_item
-            is_match = list_item_info_service.item_file_name(item).find(s) >= 0
-            if is_match:
-                debug('CustomListBox.search', found=True)
-                found = True
-            if is_current:
-                debug('CustomListBox.search', cur_line=self.cur_line)
-                new_current_line = len(content)
-            if is_match or is_current:
-                content.append(item)
-
-        return found, new_current_line, content
+    def append_items(self, items: Sequence[ListItem]) -> bool:
+        """
+        Add items, that arrived from a streaming scan; selection stays on the same item,
+        unless the item with pending_name has arrived: then it is selected, and True is returned
+        """
+        cur_name = list_item_info_service.item_file_name(self.items[self.cur_line]) if self.items else None
+        self.all_items.extend(items)
+        self.all_items.sort(key=list_item_info_service.sort_key)
+        self.search_index.reset()
+        self.row_cache.clear()
+        self.width = self.w = max(self.width, list_item_info_service.max_item_text_length(items))
+        self.show_all_items()
+        pending_line = list_item_info_service.index_of_item_file_name(self.pending_name, self.items)
+        if pending_line is not None:
+            self.pending_name = None
+            self.cur_line = self.choice = pending_line
+        else:
+            self.cur_line = self.choice = list_item_info_service.index_of_item_file_name(cur_name, self.items) or 0
+        self.make_cur_line_visible()
+        return pending_line is not None
+
+    def replace_items(self, items: Sequence[ListItem]) -> bool:
+        """ New listing of the folder; selection stays on the same name. False if that name is gone """
+        cur_name = list_item_info_service.item_file_name(self.items[self.cur_line]) if self.items else None
+        self.cancel_scan()
+        self.all_items = items
+        self.search_index = SearchIndex(items, self.search_index.fuzzy)
+        self.row_cache.clear()
+        window = range(self.top_line, self.top_line + self.height)
+        self.width = self.w = max(self.width, estimated_max_text_length(items, window))
+        self.show_all_items()
+        cur_line = list_item_info_service.index_of_item_file_name(cur_name, self.items)
+        self.cur_line = self.choice = max(0, min(self.cur_line, len(self.items) - 1)) if cur_line is None else cur_line
+        self.make_cur_line_visible()
+        return cur_line is not None
+
+    def cancel_scan(self):
+        self.pending_name = None
+        if self.scan is not None:
+            self.scan.cancel()
+            self.scan = None
+
+    def show_all_items(self):
+        self.set_items(self.all_items)
+        self.item_indices = None
+        self.match_rows = None
+
+    def apply_search(self, s: str):
+        """ Show the matching items, and the current item, even if it does not match """
+        if not self.items:
+            return
+        cur_index = self.cur_line if self.item_indices is None else self.item_indices[self.cur_line]
+        matches = self.search_index.matches(s)
+        if self.search_index.fuzzy and s != '':
+            self.show_ranked(s, matches, cur_index)
+            return
+        if len(matches) == len(self.all_items):
+            self.show_all_items()
+            self.cur_line = cur_index
+            self.match_rows = (s, matches)
+            return
+
+        at = bisect.bisect_left(matches, cur_index)
+        if at < len(matches) and matches[at] == cur_index:
+            indices = matches
+            rows = range(len(indices))
+        else:
+            indices = [*matches[:at], cur_index, *matches[at:]]
+            rows = [*range(at), *range(at + 1, len(indices))]
+        self.set_items(ListItemsView(self.all_items, indices))
+        self.item_indices = indices
+        self.cur_line = at
+        self.match_rows = (s, rows)
+
+    def show_ranked(self, s: str, matches: Sequence[int], cur_index: int):
+        """ Show the matching items, best first; the current item stays on top, if it does not match """
+        ranked = self.search_index.ranked(s)
+        at = bisect.bisect_left(matches, cur_index)
+        if at < len(matches) and matches[at] == cur_index:
+            indices = list(ranked)
+            rows = range(len(indices))
+            self.cur_line = indices.index(cur_index)
+        else:
+            indices = [cur_index, *ranked]
+            rows = range(1, len(indices))
+            self.cur_line = 0
+        self.set_items(ListItemsView(self.all_items, indices))
+        self.item_indices = indices
+        self.match_rows = (s, rows)
+
+    def matching_rows(self, s: str) -> Sequence[int]:
+        """ Sorted indices of the shown items, that match s """
+        if self.match_rows is None or self.match_rows[0] != s:
+            matches = self.search_index.matches(s)
+            if self.item_indices is None:
+                rows = matches
+            else:
+                matches = set(matches)
+                rows = [row for row, i in enumerate(self.item_indices) if i in matches]
+            self.match_rows = (s, rows)
+        return self.match_rows[1]
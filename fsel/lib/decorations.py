@@ -0,0 +1,14 @@
+from typing import Sequence, Callable
+
+
+class Decorations:
+    """ Extra attribute flags of entries, computed in the background, and added to the attributes at paint time """
+    version: int = 0  # incremented, when new decorations are available
+
+    def decorator(self, root: str) -> Callable[[Sequence[str], str], int]:
+        """ Function of (folder path, relative to root; entry name), returning the flags of the entry (none by default) """
+        return lambda folder, name: 0
+
+    def is_pending(self) -> bool:
+        """ True while the decorations are being computed """
+        return False
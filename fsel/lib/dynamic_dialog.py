@@ -1,6 +1,7 @@
 from picotui.screen import Screen
 from picotui.widgets import Dialog
 
+from fsel.lib.timing import startup_timing
 from fsel.lib.tui.paint_context import p_ctx
 
 
@@ -20,6 +21,7 @@ class DynamicDialog(Dialog):
             Screen.goto(0, self.screen_height - 1)
             for _ in range(overshoot):
                 Screen.wr('\r\n')
+            p_ctx.scroll_up(overshoot)
             self.y -= overshoot
 
     def redraw(self):
@@ -33,7 +35,8 @@ class DynamicDialog(Dialog):
         self.clear()
         for w in self.childs:
             w.redraw()
+        startup_timing.mark_once('first paint')
 
     def clear(self):
-        self.attr_reset()
+        p_ctx.attr_reset()
         p_ctx.clear_box(self.x, self.y, self.w, self.h)
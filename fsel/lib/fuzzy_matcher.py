@@ -0,0 +1,105 @@
+import re
+from itertools import compress, repeat
+from operator import contains
+from typing import Optional, List, Tuple, Sequence
+
+SEPARATORS = '/\\_-. '
+
+
+class FuzzyMatcher:
+    """
+    Matches names, that contain the characters of the query in the same order (case-insensitive),
+    and scores the match: matches at word boundaries (after separators, at camelCase humps),
+    consecutive matches and matches in the same case score higher, gaps between matched characters score lower.
+    """
+    BONUS_MATCH = 16
+    BONUS_BOUNDARY = 8
+    BONUS_CONSECUTIVE = 4
+    BONUS_CASE = 1
+    PENALTY_GAP = 1
+
+    def __init__(self, query: str):
+        self.query = query
+        self.lower_query = FuzzyMatcher.lower(query)
+        # matches the query as a subsequence; negated classes make it match without backtracking
+        self.regex = re.compile(''.join(f'[^{re.escape(c)}]*{re.escape(c)}' for c in self.lower_query), re.DOTALL)
+
+    def filter(self, lower_names: Sequence[str], candidates: Sequence[int]) -> List[int]:
+        """ Those of candidates (indices of lower_names, made by lower()), whose names match; the loop runs in C """
+        names = map(lower_names.__getitem__, candidates)
+        if len(self.lower_query) == 1:
+            return list(compress(candidates, map(contains, names, repeat(self.lower_query))))
+        return list(compress(candidates, map(self.regex.match, names)))
+
+    def match(self, name: str) -> Optional[Tuple[int, List[int]]]:
+        """ Score and positions of the best of two alignments: the leftmost one, and the one preferring word boundaries """
+        lower_name = FuzzyMatcher.lower(name)
+        positions = self.leftmost(lower_name)
+        if positions is None:
+            return None
+        best = self.score(name, positions), positions
+        positions = self.at_boundaries(name, lower_name)
+        if positions is not None:
+            best = max(best, (self.score(name, positions), positions))
+        return best
+
+    def leftmost(self, lower_name: str) -> Optional[List[int]]:
+        """ Leftmost match, then tightened from its end backwards """
+        positions = []
+        start = 0
+        for c in self.lower_query:
+            i = lower_name.find(c, start)
+            if i < 0:
+                return None
+            positions.append(i)
+            start = i + 1
+        end = positions[-1] + 1
+        for k in range(len(self.lower_query) - 1, -1, -1):
+            end = positions[k] = lower_name.rfind(self.lower_query[k], 0, end)
+        return positions
+
+    def at_boundaries(self, name: str, lower_name: str) -> Optional[List[int]]:
+        """ Every character is matched at the nearest word boundary, if any, or else at its nearest occurrence """
+        positions = []
+        start = 0
+        for c in self.lower_query:
+            i = lower_name.find(c, start)
+            if i < 0:
+                return None
+            j = i
+            while j >= 0 and not FuzzyMatcher.is_boundary(name, j):
+                j = lower_name.find(c, j + 1)
+            positions.append(i if j < 0 else j)
+            start = positions[-1] + 1
+        return positions
+
+    def score(self, name: str, positions: List[int]) -> int:
+        score = 0
+        previous = -1
+        for k, i in enumerate(positions):
+            score += FuzzyMatcher.BONUS_MATCH
+            if FuzzyMatcher.is_boundary(name, i):
+                score += FuzzyMatcher.BONUS_BOUNDARY
+            if name[i] == self.query[k]:
+                score += FuzzyMatcher.BONUS_CASE
+            if i == previous + 1:
+                score += FuzzyMatcher.BONUS_CONSECUTIVE
+            elif previous >= 0:
+                score -= FuzzyMatcher.PENALTY_GAP * (i - previous - 1)
+            previous = i
+        return score
+
+    @staticmethod
+    def lower(s: str) -> str:
+        """ Lower case of s, of the same length (some characters, like 'İ', become two in lower case) """
+        lower = s.lower()
+        if len(lower) == len(s):
+            return lower
+        return ''.join(c.lower()[0] for c in s)
+
+    @staticmethod
+    def is_boundary(name: str, i: int) -> bool:
+        if i == 0:
+            return True
+        before = name[i - 1]
+        return before in SEPARATORS or before.islower() and name[i].isupper() or not before.isdigit() and name[i].isdigit()
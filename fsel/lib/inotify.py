@@ -0,0 +1,136 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+from typing import Optional, List, Tuple, Dict, Iterable
+
+from .logging import debug
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Inotify:
+    """ Minimal inotify(7) binding through ctypes: a non-blocking descriptor, that can be waited on with select() """
+
+    def __init__(self, libc, fd: int):
+        self.libc = libc
+        self.fd = fd
+
+    @staticmethod
+    def create() -> Optional['Inotify']:
+        """ None if inotify is not available (not Linux, or out of instances) """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            debug('Inotify.create', error=str(e))
+            return None
+        if fd < 0:
+            debug('Inotify.create', error=os.strerror(ctypes.get_errno()))
+            return None
+        return Inotify(libc, fd)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """ Watch descriptor, or -1 on error (e.g. the folder has vanished) """
+        return self.libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+
+    def rm_watch(self, wd: int):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """ (wd, mask, name) of the pending events; empty list if there are none """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Watches a changing set of folders (paths relative to the root) for entries being created, removed or renamed,
+    and for changes of attributes of entries (e.g. extended attributes).
+    """
+    MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    def __init__(self, inotify: Inotify, root: str):
+        self.inotify = inotify
+        self.root = root
+        self.wds: Dict[Tuple[str, ...], int] = {}
+        self.paths: Dict[int, Tuple[str, ...]] = {}
+
+    @staticmethod
+    def create(root: str) -> Optional['FolderWatcher']:
+        inotify = Inotify.create()
+        return None if inotify is None else FolderWatcher(inotify, root)
+
+    def fileno(self) -> int:
+        return self.inotify.fileno()
+
+    def watch_only(self, folders: Iterable[Tuple[str, ...]]):
+        """ Watch these folders, and stop watching the others """
+        folders = set(folders)
+        for folder in self.wds.keys() - folders:
+            wd = self.wds.pop(folder)
+            self.paths.pop(wd, None)
+            self.inotify.rm_watch(wd)
+        for folder in folders - self.wds.keys():
+            self.watch(folder)
+
+    def watch(self, folder: Tuple[str, ...]):
+        """ Start watching the folder now (e.g. before its listing is checked), rather than on the next watch_only() """
+        if folder not in self.wds:
+            wd = self.inotify.add_watch(os.path.join(self.root, *folder), FolderWatcher.MASK)
+            if wd >= 0:
+                self.wds[folder] = wd
+                self.paths[wd] = folder
+
+    def changed_folders(self) -> Optional[set]:
+        """ Watched folders, whose entries have changed since the last call; None if events were lost """
+        changed = set()
+        for wd, mask, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                return None
+            folder = self.paths.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:  # the folder itself is gone
+                self.paths.pop(wd, None)
+                self.wds.pop(folder, None)
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                if folder:
+                    changed.add(folder[:-1])
+            else:
+                changed.add(folder)
+        return changed
+
+    def close(self):
+        self.inotify.close()
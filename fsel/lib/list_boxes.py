@@ -1,10 +1,16 @@
-from typing import Optional, List, Callable, Sequence
+from typing import Optional, List, Callable, Sequence, Iterator
 
 from fsel.lib.list_item_info_service import list_item_info_service
 from .list_item import ListItem
+from .list_items import estimated_max_text_length
 from .logging import debug
 from .custom_list_box import CustomListBox
+from .decorations import Decorations
+from .inotify import FolderWatcher
 from .oracle import Oracle
+from .prefetcher import Prefetcher
+from .revalidations import Revalidations
+from .streaming_scan import StreamingScan
 
 
 class ListBoxes:
@@ -13,10 +19,27 @@ class ListBoxes:
     search_string: str = ''
     match_string: str = ''
 
-    def __init__(self, entry_lister: Callable[[Sequence[str]], Sequence[ListItem]], oracle: Oracle, initial_path: List):
+    def __init__(self, entry_lister: Callable[[Sequence[str]], Sequence[ListItem]], oracle: Oracle, initial_path: List,
+                 prefetcher: Optional[Prefetcher] = None,
+                 folder_streamer: Optional[Callable[[Sequence[str]], Optional[Iterator[Sequence[ListItem]]]]] = None,
+                 details_resolver: Optional[Callable[[Sequence[str], ListItem], None]] = None,
+                 fuzzy: bool = False, decorations: Optional[Decorations] = None,
+                 watcher: Optional[FolderWatcher] = None,
+                 invalidator: Optional[Callable[[Sequence[str]], None]] = None,
+                 revalidations: Optional[Revalidations] = None):
         debug('ListBoxes', initial_path=initial_path)
         self.entry_lister = entry_lister
         self.oracle = oracle
+        self.prefetcher = prefetcher
+        self.folder_streamer = folder_streamer
+        self.details_resolver = details_resolver
+        self.fuzzy = fuzzy
+        self.decorations = decorations
+        self.decorator = None if decorations is None else decorations.decorator(entry_lister.root)
+        self.decorations_version = None if decorations is None else decorations.version
+        self.watcher = watcher  # watches the folders of the boxes
+        self.invalidator = invalidator  # drops cached listing of a folder
+        self.revalidations = revalidations  # reports folders, that were shown from an out-of-date snapshot
         self.boxes = self.boxes_for_path(initial_path)
         debug('ListBoxes', boxes=self.boxes)
 
@@ -24,18 +47,24 @@ class ListBoxes:
         debug('ListBoxes.search', s=s)
         self.search_string = s
 
-        found_somewhere = False
-        for box in self.boxes:
-            found, new_current_line, content = box.search(s)
-            found_somewhere |= found
+        # matches are kept by the search index of every box, and are not searched again, when applied
+        found_somewhere = any(len(box.search_index.matches(s)) > 0 for box in self.boxes)
         debug('ListBoxes.search', found_somewhere=found_somewhere)
 
         if found_somewhere:
             self.match_string = s
             for box in self.boxes:
-                found, new_current_line, content = box.search(s)
-                box.set_items(content)
-                box.cur_line = new_current_line
+                box.apply_search(s)
+
+    def jump_to(self, path: Sequence[str]):
+        """ Rebuild the boxes to show the path (relative to the root), that may be far from the current one """
+        for box in self.boxes:
+            box.cancel_scan()
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()  # the neighbourhood of the old path is not wanted anymore
+        self.search_string = self.match_string = ''
+        self.boxes = self.boxes_for_path(path)
+        self.expand_lists()
 
     def boxes_for_path(self, initial_path: Sequence[str]) -> List[CustomListBox]:
         boxes = []
@@ -69,6 +98,8 @@ class ListBoxes:
             if self.is_at_leaf(index):
                 debug("expand_lists", index=index, is_at_leaf=True)
                 break
+            if self.boxes[index].pending_name is not None:  # expanded, when the selection settles (see poll_scans())
+                break
             path = self.path(index)
             name = self.oracle.recall_chosen_name(path)
             index += 1
@@ -85,6 +116,8 @@ class ListBoxes:
 
     def activate_sibling(self, index):
         # debug("activate_sibling", index=index)
+        for box in self.boxes[index + 1:]:
+            box.cancel_scan()
         self.boxes = self.boxes[: index + 1]
         self.expand_lists()
         self.memorize_choice_in_list(index, False)
@@ -109,23 +142,169 @@ class ListBoxes:
         self.expand_lists()
         return True
 
+    def prefetch_around(self, index):
+        """ Prefetch the children of the selected item in the box and of its neighbours (unless leaves or ignored) """
+        if self.prefetcher is None or not 0 <= index < len(self.boxes):
+            return
+        box = self.boxes[index]
+        paths = []
+        for line in (box.cur_line, box.cur_line + 1, box.cur_line - 1):
+            if 0 <= line < len(box.items) and not list_item_info_service.is_leaf(box.items[line]) \
+                    and not list_item_info_service.is_ignored(box.items[line]):
+                paths.append([*box.folder, list_item_info_service.item_file_name(box.items[line])])
+        self.prefetcher.prefetch(paths)
+
+    def poll_scans(self) -> bool:
+        """ Move items, that arrived from streaming scans, into the boxes; True if any box has changed """
+        changed = False
+        settled_index = None  # of the box, whose pending selection has settled: the boxes after it are rebuilt
+        for index, box in enumerate(self.boxes):
+            if box.scan is None:
+                continue
+            items = box.scan.drain()
+            if items:
+                if box.append_items(items) and settled_index is None:
+                    settled_index = index
+                if self.match_string:
+                    box.apply_search(self.match_string)
+                changed = True
+            if box.scan.is_finished():
+                box.scan = None
+                if box.pending_name is not None:  # has not arrived: the selection stays
+                    box.pending_name = None
+                    settled_index = index if settled_index is None else settled_index
+                    changed = True
+        if settled_index is not None:
+            for box in self.boxes[settled_index + 1:]:
+                box.cancel_scan()
+            self.boxes = self.boxes[:settled_index + 1]
+            self.expand_lists()
+        return changed
+
+    def close(self):
+        """ Stop the background work for the boxes """
+        for box in self.boxes:
+            box.cancel_scan()
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+
+    def has_pending_scans(self):
+        return any(box.scan is not None for box in self.boxes)
+
+    def watched_fds(self) -> List[int]:
+        """ Descriptors, that become readable, when the folders of the boxes change (see refresh_changed()) """
+        if self.watcher is None:
+            return []
+        self.watcher.watch_only(tuple(box.folder) for box in self.boxes)
+        return [self.watcher.fileno()]
+
+    def refresh_changed(self) -> bool:
+        """ Re-list the boxes, whose folders have changed; True if any box has changed """
+        changed = self.watcher.changed_folders() if self.watcher is not None else set()
+        if changed is None:  # events were lost
+            changed = {tuple(box.folder) for box in self.boxes}
+        for folder in changed:
+            if self.invalidator is not None:
+                self.invalidator(folder)
+        if self.revalidations is not None:
+            changed |= self.revalidations.changed_folders()  # these are re-listed already
+        if not changed:
+            return False
+        debug('ListBoxes.refresh_changed', changed=changed)
+
+        for folder in changed:
+            if self.prefetcher is not None:
+                self.prefetcher.invalidate(folder)
+
+        for index, box in enumerate(self.boxes):
+            if tuple(box.folder) not in changed:
+                continue
+            items = self.entry_lister(box.folder)
+            if len(items) > 0 and box.replace_items(items):
+                if self.match_string:
+                    box.apply_search(self.match_string)
+                continue
+            # the selected entry is gone: the boxes after this one show what is not there anymore
+            had_focus = any(b.focus for b in self.boxes[index:])
+            for b in self.boxes[index + 1:]:
+                b.cancel_scan()
+            if index == 0 and len(items) == 0:
+                box.replace_items(items)  # the box of the root stays, even if empty: there is always a box
+            self.boxes = self.boxes[:index + (1 if len(items) > 0 or index == 0 else 0)]
+            if had_focus:
+                self.boxes[-1].focus = True
+            self.expand_lists()
+            break
+        return True
+
+    def has_pending_revalidations(self):
+        return self.revalidations is not None and self.revalidations.is_pending()
+
+    def has_pending_decorations(self):
+        return self.decorations is not None and self.decorations.is_pending()
+
+    def poll_decorations(self) -> bool:
+        """ True if new decorations have arrived since the last call (the boxes need repainting) """
+        if self.decorations is None or self.decorations.version == self.decorations_version:
+            return False
+        self.decorations_version = self.decorations.version
+        return True
+
     def make_box_or_none(self, path: Sequence[str], preferred: Optional[str] = None) -> Optional[CustomListBox]:
         # debug("make_box_or_none", path=path)
-        items = self.entry_lister(path)
+        items = None
+        if self.prefetcher is not None:
+            if self.watcher is not None:
+                self.watcher.watch(tuple(path))  # changes after the check of the prefetched listing are not missed
+            items = self.prefetcher.take(path)
+        if items is None and self.folder_streamer is not None:
+            batches = self.folder_streamer(path)
+            if batches is not None:
+                return self.make_streaming_box_or_none(path, batches, preferred)
+        if items is None:
+            items = self.entry_lister(path)
         if len(items) == 0:
             # debug("make_box_or_none", items_length=0)
             return None
         return self.make_box(path, items, preferred)
 
+    def make_streaming_box_or_none(self, path: Sequence[str], batches: Iterator[Sequence[ListItem]],
+                                   preferred: Optional[str] = None) -> Optional[CustomListBox]:
+        """
+        Make the box from the first batch; the rest of the items is delivered by poll_scans().
+        The preferred item is listed synchronously, if it is not in the first batch;
+        the recalled one, if not there, is selected when it arrives (see CustomListBox.pending_name)
+        """
+        items = list(next(batches, []))
+        if preferred is not None and not StreamingScan.contains(items, preferred):
+            for batch in batches:
+                items.extend(batch)
+                if StreamingScan.contains(batch, preferred):
+                    break
+        scan = StreamingScan(batches)
+        if len(items) == 0:
+            scan.cancel()
+            return None
+        items.sort(key=list_item_info_service.sort_key)
+        box = self.make_box(path, items, preferred)
+        box.scan = scan
+        recalled_name = None if preferred else self.oracle.recall_chosen_name(path)
+        if recalled_name is not None and not StreamingScan.contains(items, recalled_name):
+            box.pending_name = recalled_name
+        return box
+
     def make_box(self, path: Sequence[str], items: Sequence[ListItem], preferred: Optional[str] = None):
         # debug("make_box", items=items, items_length=len(items), path=path)
         box = CustomListBox(
-            list_item_info_service.max_item_text_length(items),
+            estimated_max_text_length(items),
             len(items),
             items,
             path,
             lambda: self.match_string,
-            lambda: self.match_string == self.search_string
+            lambda: self.match_string == self.search_string,
+            self.details_resolver,
+            self.fuzzy,
+            self.decorator
         )
         last_name = self.oracle.recall_chosen_name(path) if not preferred else preferred
         choice = list_item_info_service.index_of_item_file_name(last_name, items)
@@ -133,17 +312,23 @@ class ListBoxes:
         return box
 
     def memorize_choice_in_list(self, index, persistent: bool):
+        item = self.selected_item_in_list(index)
+        if item is None:
+            return
         parent_path = [] if index == 0 else self.path(index - 1)
-        self.oracle.memorize(parent_path, list_item_info_service.item_file_name(self.selected_item_in_list(index)), persistent)
+        self.oracle.memorize(parent_path, list_item_info_service.item_file_name(item), persistent)
 
     def index_of_last_list(self):
         return len(self.boxes) - 1
 
     def is_at_leaf(self, index):
-        return list_item_info_service.is_leaf(self.selected_item_in_list(index))
+        item = self.selected_item_in_list(index)
+        return item is None or list_item_info_service.is_leaf(item)
 
-    def selected_item_in_list(self, index):
-        return self.boxes[index].items[self.boxes[index].cur_line]
+    def selected_item_in_list(self, index) -> Optional[ListItem]:
+        """ None if the box is empty (only the box of the root can be: its folder may become empty) """
+        box = self.boxes[index]
+        return box.items[box.cur_line] if box.items else None
 
     def max_child_height(self):
         return max(len(child.items) for child in self.boxes)
@@ -152,7 +337,7 @@ class ListBoxes:
         return len(self.boxes) == 0
 
     def path(self, index) -> List[str]:
-        return [list_item_info_service.item_file_name(l.items[l.cur_line]) for l in self.boxes[: index + 1]]
+        return [list_item_info_service.item_file_name(item) for item in self.items_path(index)]
 
     def items_path(self, index):
-        return [l.items[l.cur_line] for l in self.boxes[: index + 1]]
+        return [l.items[l.cur_line] for l in self.boxes[: index + 1] if l.items]
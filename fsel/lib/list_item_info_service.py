@@ -9,6 +9,15 @@ class ListItemInfoService:
     FLAG_DIRECTORY = 0x8000
     FLAG_ITALIC = 0x10000
     FLAG_STRIKE_THRU = 0x20000
+    FLAG_DETAILS_PENDING = 0x40000  # description and strike-thru flag are not resolved yet
+    FLAG_IGNORED = 0x80000  # matched by .gitignore/.ignore (shown dimmed); children are not scanned
+    # git status decorations: not stored in items, but added at paint time
+    FLAG_GIT_MODIFIED = 0x100000  # changed (in the index or in the work tree), or contains changed entries
+    FLAG_GIT_UNTRACKED = 0x200000  # untracked, or contains untracked entries
+    FLAG_GIT_IGNORED = 0x400000
+
+    STYLE_PLAIN = Style.of()
+    STYLE_DESCRIPTION = Style.of(fg=Color.YELLOW)
 
     def attrs(self, item: ListItem) -> int:
         return item.attrs
@@ -22,8 +31,18 @@ class ListItemInfoService:
     def is_strike_thru(self, item: ListItem):
         return (item.attrs & ListItemInfoService.FLAG_STRIKE_THRU) != 0
 
+    def is_ignored(self, item: ListItem):
+        return (item.attrs & ListItemInfoService.FLAG_IGNORED) != 0
+
+    def is_details_pending(self, item: ListItem):
+        return (item.attrs & ListItemInfoService.FLAG_DETAILS_PENDING) != 0
+
+    def sort_key(self, item: ListItem):
+        """ Folders first, then files; by name """
+        return self.is_leaf(item), item.name
+
     def max_item_text_length(self, items):
-        return max(self.item_text_length(item) for item in items)
+        return max((self.item_text_length(item) for item in items), default=0)
 
     def item_text(self, item: ListItem) -> str:
         if item.description is not None:
@@ -32,11 +51,11 @@ class ListItemInfoService:
             return item.name
 
     def item_rich_text(self, item: ListItem) -> list[Tuple[str, Style]]:
-        rich_text = [(item.name, Style())]
+        rich_text = [(item.name, ListItemInfoService.STYLE_PLAIN)]
 
         if item.description is not None:
-            rich_text.append((' ', Style()))
-            rich_text.append((item.description, Style(fg=Color.YELLOW)))
+            rich_text.append((' ', ListItemInfoService.STYLE_PLAIN))
+            rich_text.append((item.description, ListItemInfoService.STYLE_DESCRIPTION))
 
         return rich_text
 
@@ -51,6 +70,11 @@ class ListItemInfoService:
         return item.name
 
     def index_of_item_file_name(self, file_name: str, items: Iterable[ListItem]) -> int|None:
+        if file_name is None:
+            return None
+        index_of_name = getattr(items, 'index_of_name', None)  # ListItems: binary search
+        if index_of_name is not None:
+            return index_of_name(file_name)
         for i, item in enumerate(items):
             if file_name == self.item_file_name(item):
                 return i
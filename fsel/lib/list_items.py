@@ -0,0 +1,118 @@
+from array import array
+from bisect import bisect_left
+from typing import Sequence, List, Dict, Iterable, Iterator, Optional
+
+from fsel.lib.list_item_info_service import list_item_info_service
+from .list_item import ListItem
+
+WIDTH_SAMPLE_SIZE = 1000
+
+
+class ListItems(Sequence[ListItem]):
+    """
+    Listing of a folder, sorted by list_item_info_service.sort_key, in a compact form:
+    names, attributes (in an array), and the descriptions of the few items, that have them.
+    ListItem objects are made only for the items, that are accessed by index (the visible ones);
+    they stay live (so that changes to them, e.g. resolved details, are seen), until there are more than
+    LIVE_CAPACITY of them: then their fields are written back, and they are dropped.
+    """
+    LIVE_CAPACITY = 4096
+
+    names: List[str]
+    attrs: array
+    descriptions: Dict[int, str]
+    live: Dict[int, ListItem]
+
+    def __init__(self, names: List[str], attrs: array, descriptions: Dict[int, str], folder_count: int):
+        self.names = names
+        self.attrs = attrs
+        self.descriptions = descriptions
+        self.folder_count = folder_count  # folders come first
+        self.live = {}
+
+    @staticmethod
+    def pack(items: Iterable[ListItem]) -> 'ListItems':
+        items = sorted(items, key=list_item_info_service.sort_key)
+        descriptions = {i: item.description for i, item in enumerate(items) if item.description is not None}
+        folder_count = 0
+        while folder_count < len(items) and not list_item_info_service.is_leaf(items[folder_count]):
+            folder_count += 1
+        return ListItems([item.name for item in items], array('Q', [item.attrs for item in items]), descriptions,
+                         folder_count)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.names)))]
+        if index < 0:
+            index += len(self.names)
+        item = self.live.get(index)
+        if item is None:
+            if len(self.live) >= ListItems.LIVE_CAPACITY:
+                self.write_back()
+            item = self.live[index] = ListItem(
+                name=self.names[index], attrs=self.attrs[index], description=self.descriptions.get(index)
+            )
+        return item
+
+    def __iter__(self) -> Iterator[ListItem]:
+        """ Live items, and copies of the others (that are not made live) """
+        for i, name in enumerate(self.names):
+            item = self.live.get(i)
+            yield item if item is not None else ListItem(name=name, attrs=self.attrs[i], description=self.descriptions.get(i))
+
+    def write_back(self):
+        for i, item in self.live.items():
+            self.attrs[i] = item.attrs
+            if item.description is not None:
+                self.descriptions[i] = item.description
+            else:
+                self.descriptions.pop(i, None)
+        self.live.clear()
+
+    def text_length(self, index: int) -> int:
+        """ Same as list_item_info_service.item_text_length(self[index]), without making the item live """
+        item = self.live.get(index)
+        if item is not None:
+            return list_item_info_service.item_text_length(item)
+        description = self.descriptions.get(index)
+        return len(self.names[index]) + (0 if description is None else 1 + len(description))
+
+    def index_of_name(self, name: str) -> Optional[int]:
+        """ Binary search among the folders, then among the files """
+        for lo, hi in ((0, self.folder_count), (self.folder_count, len(self.names))):
+            i = bisect_left(self.names, name, lo, hi)
+            if i < hi and self.names[i] == name:
+                return i
+        return None
+
+
+def estimated_max_text_length(items: Sequence[ListItem], window: range = range(0)) -> int:
+    """
+    Maximum of list_item_info_service.item_text_length of the items: exact for short lists;
+    for longer ones, estimated from an even sample of WIDTH_SAMPLE_SIZE items and the items in the window (the visible ones)
+    """
+    if len(items) <= WIDTH_SAMPLE_SIZE:
+        return list_item_info_service.max_item_text_length(items)
+    indices = [*range(0, len(items), len(items) // WIDTH_SAMPLE_SIZE), *(i for i in window if i < len(items))]
+    if isinstance(items, ListItems):
+        return max(items.text_length(i) for i in indices)
+    return max(list_item_info_service.item_text_length(items[i]) for i in indices)
+
+
+class ListItemsView(Sequence[ListItem]):
+    """ Items of a listing at the given indices (e.g. the matching ones), without copying them """
+
+    def __init__(self, items: Sequence[ListItem], indices: Sequence[int]):
+        self.items = items
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.items[i] for i in self.indices[row]]
+        return self.items[self.indices[row]]
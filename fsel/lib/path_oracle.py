@@ -1,64 +1,171 @@
-from typing import Optional, List, Dict, AnyStr, Sequence
+import math
+import time
+from typing import Optional, List, Dict, AnyStr, Sequence, Callable
 
 from .oracle import Oracle
 
+# In usage stats, marks an entry, whose children are kept in a separate shard (the value), and are not loaded yet
+SHARD = '..'
+
+# Score of an entry, that has not been visited (stored as None)
+NO_SCORE = float('-inf')
+
 
 class PathOracle(Oracle):
-    def __init__(self, root_history: Dict, usage_stats: Dict):
+    """
+    Predicts the choice in a folder by frecency of the choices made there before.
+    Every entry of usage stats has counters in its '.' key: [count, score, best child].
+    A visit at time t weighs 2^((t - EPOCH) / HALF_LIFE), and the score is log2 of the sum of the weights of the visits:
+    scores of all entries are relative to the same EPOCH, so they can be compared without re-computing the decay,
+    and never decrease; kept in log space, they grow only linearly with time, and do not overflow.
+    Hence, only the visited child can overtake the best child of its parent, and memorize updates it in O(1).
+    Legacy entries have plain counts in '.'; they are taken as visits made at the time of migration (see migrate()).
+    """
+    EPOCH = 1767225600  # 2026-01-01
+    HALF_LIFE = 30 * 24 * 3600
+
+    def __init__(self, root_history: Dict, usage_stats: Dict,
+                 on_persistent_memorize: Optional[Callable[[List[AnyStr], AnyStr], None]] = None,
+                 shard_loader: Optional[Callable[[AnyStr], Dict]] = None):
         self.root_history = root_history
         self.usage_stats = usage_stats
+        self.on_persistent_memorize = on_persistent_memorize
+        self.shard_loader = shard_loader
         self.visit_history = {}
         self.session_stats = {}
 
-    def memorize(self, path: List[AnyStr], name: AnyStr, persistent: bool):
+    def memorize(self, path: List[AnyStr], name: AnyStr, persistent: bool, t: Optional[float] = None):
         history = self.root_history if persistent else self.visit_history
         history[self.string_path(path)] = name
-        stat_path = []
-        stat_path += path
-        stat_path.append(name)
-        stat_path.append('.') # '.' is a special entry for counter
         if persistent:
-            self.incr(self.usage_stats, stat_path)
-        # self.incr(self.usage_stats if persistent else self.session_stats, stat_path)
+            self.visit(self.usage_stats, [*path, name], time.time() if t is None else t)
+            if self.on_persistent_memorize is not None:
+                self.on_persistent_memorize(path, name)
+
+    def forget(self, path: List[AnyStr]):
+        """ Removes the entry at path, with all its sub-tree """
+        parent = self.get_entry(self.usage_stats, path[:-1])
+        if parent is None or parent.pop(path[-1], None) is None:
+            return
+        counters = parent.get('.')
+        if type(counters) is list and counters[2] == path[-1]:
+            counters[2] = None
 
     def recall_chosen_name(self, path: List[AnyStr]) -> Optional[AnyStr]:
         # string_path = self.string_path(path)
         # return self.visit_history.get(string_path) or self.root_history.get(string_path)
         entry = self.get_entry(self.usage_stats, path)
         if entry is not None:
-            return self.most_frequent_in(entry)
+            return self.best_child(entry)
         return None
 
-    def most_frequent_in(self, entry: Dict) -> Optional[AnyStr]:
-        top_f = 0
+    def best_child(self, entry: Dict) -> Optional[AnyStr]:
+        counters = entry.get('.')
+        if type(counters) is list and counters[2] is not None:
+            return counters[2]
+        best = self.most_frecent_in(entry)
+        if best is not None:
+            PathOracle.set_counters(entry, *PathOracle.counters(entry)[:2], best)
+        return best
+
+    def most_frecent_in(self, entry: Dict) -> Optional[AnyStr]:
+        top_score = NO_SCORE
         result = None
         for k, v in entry.items():
-            if k != '.':
-                f = v['.']
-                if f > top_f:
-                    top_f = f
+            if k != '.' and k != SHARD:
+                score = PathOracle.counters(v)[1]
+                if score > top_score:
+                    top_score = score
                     result = k
         return result
 
-    def incr(self, stats: Dict, path: List):
-        if len(path) == 1:
-            value = stats.get(path[0]) or 0
-            stats[path[0]] = value + 1
-        else:
-            entry = stats.get(path[0])
-            if entry is None:
-                entry = {}
-                stats[path[0]] = entry
+    def visit(self, stats: Dict, path: List, t: float):
+        """ Adds the visit to the counters of the entry at path, and updates the best child of its parent """
+        entry = stats
+        for name in path[:-1]:
+            entry = entry.setdefault(name, {})
+        name = path[-1]
+        best = self.best_child(entry)
+        child = entry.setdefault(name, {})
+        count, score, child_best = PathOracle.counters(child)
+        score = PathOracle.add_scores(score, (t - PathOracle.EPOCH) / PathOracle.HALF_LIFE)
+        child['.'] = [count + 1, score, child_best]
+
+        best_entry = None if best is None else entry.get(best)
+        if best is None or best == name \
+                or best_entry is None and SHARD not in entry \
+                or best_entry is not None and PathOracle.counters(best_entry)[1] < score:
+            PathOracle.set_counters(entry, *PathOracle.counters(entry)[:2], name)
 
-            self.incr(entry, path[1:])
+    @staticmethod
+    def counters(entry: Dict) -> List:
+        """ [count, score, best child] of the entry; legacy counts are taken as visits made now """
+        counters = entry.get('.')
+        if counters is None:
+            return [0, NO_SCORE, None]
+        if type(counters) is not list:
+            return [counters, PathOracle.legacy_score(counters, time.time()), None]
+        if counters[1] is None:
+            return [counters[0], NO_SCORE, counters[2]]
+        return counters
+
+    @staticmethod
+    def set_counters(entry: Dict, count: int, score: float, best: Optional[AnyStr]):
+        entry['.'] = [count, None if score == NO_SCORE else score, best]
+
+    @staticmethod
+    def add_scores(score: float, other_score: float) -> float:
+        """ log2(2^score + 2^other_score) """
+        if score < other_score:
+            score, other_score = other_score, score
+        if other_score == NO_SCORE:
+            return score
+        return score + math.log2(1 + 2 ** (other_score - score))
+
+    @staticmethod
+    def legacy_score(count: int, t: float) -> float:
+        if count <= 0:
+            return NO_SCORE
+        return math.log2(count) + (t - PathOracle.EPOCH) / PathOracle.HALF_LIFE
+
+    @staticmethod
+    def migrate(stats: Dict, t: float):
+        """ Converts legacy counts in stats to counters, taking them as visits made at t """
+        counters = stats.get('.')
+        if counters is not None and type(counters) is not list:
+            PathOracle.set_counters(stats, counters, PathOracle.legacy_score(counters, t), None)
+        for v in stats.values():
+            if isinstance(v, dict):
+                PathOracle.migrate(v, t)
 
     def get_entry(self, stats: Dict, path: List):
         if len(path) == 0:
             return stats
         else:
-            entry = stats.get(path[0])
+            entry = self.child_entry(stats, path[0])
             return None if entry is None else self.get_entry(entry, path[1:])
 
+    def child_entry(self, stats: Dict, name: AnyStr) -> Optional[Dict]:
+        """ Faults in the shard with the children of the entry, if it is not loaded yet """
+        entry = stats.get(name)
+        if entry is not None and SHARD in entry and self.shard_loader is not None:
+            # the entry may already have children: counted by the journal, while the shard was not loaded
+            PathOracle.merge_stats(entry, self.shard_loader(entry.pop(SHARD)))
+        return entry
+
+    @staticmethod
+    def merge_stats(stats: Dict, other: Dict):
+        """ Adds counters from other to stats; the best child of stats is re-computed when needed """
+        for k, v in other.items():
+            if isinstance(v, dict):
+                PathOracle.merge_stats(stats.setdefault(k, {}), v)
+            elif k != '.':
+                stats[k] = v
+        if '.' in stats or '.' in other:
+            count, score, _ = PathOracle.counters(stats)
+            other_count, other_score, _ = PathOracle.counters(other)
+            PathOracle.set_counters(stats, count + other_count, PathOracle.add_scores(score, other_score), None)
+
     @staticmethod
     def string_path(path: Sequence):
         return '/'.join(path)
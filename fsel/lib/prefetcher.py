@@ -0,0 +1,103 @@
+import itertools
+import queue
+import threading
+from collections import OrderedDict
+from typing import Callable, Sequence, Optional, Tuple, Any
+
+from .list_item import ListItem
+from .logging import debug
+
+
+class Prefetcher:
+    """
+    Lists, in background threads, the folders that are likely to be opened next.
+    Every call to prefetch() starts a new generation of requests:
+    requests of older generations are served after the newer ones, and dropped when they lag too far behind.
+    With a signature function (e.g. mtime and inode of the folder), a listing is handed over only if the folder
+    has the same signature as before it was listed.
+    """
+    WORKERS = 2
+    CAPACITY = 64
+    MAX_GENERATION_LAG = 2
+
+    def __init__(self, entry_lister: Callable[[Sequence[str]], Sequence[ListItem]],
+                 signature: Optional[Callable[[Sequence[str]], Any]] = None, workers: int = WORKERS,
+                 capacity: int = CAPACITY):
+        self.entry_lister = entry_lister
+        self.signature = signature
+        self.workers = workers
+        self.capacity = capacity
+        self.tasks = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.generation = 0
+        self.cancelled_generation = 0
+        self.results: OrderedDict[Tuple[str, ...], Tuple[Any, Sequence[ListItem]]] = OrderedDict()
+        self.requested = set()
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def prefetch(self, paths: Sequence[Sequence[str]]):
+        """ Request listing of paths, most wanted first """
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            for priority, path in enumerate(paths):
+                key = tuple(path)
+                if key in self.results or key in self.requested:
+                    continue
+                self.requested.add(key)
+                self.tasks.put((-generation, priority, next(self.sequence), key))
+        self.start_workers()
+
+    def cancel(self):
+        """ Drop all pending requests, and the listings, that have not been taken """
+        with self.lock:
+            self.cancelled_generation = self.generation
+            self.results.clear()
+
+    def take(self, path: Sequence[str]) -> Optional[Sequence[ListItem]]:
+        """ Hand over prefetched listing of the path (once), or None if it is not available yet, or out of date """
+        with self.lock:
+            result = self.results.pop(tuple(path), None)
+        if result is None:
+            return None
+        signature, items = result
+        if self.signature is not None and self.signature(path) != signature:
+            debug('Prefetcher.take', path=path, stale=True)
+            return None
+        return items
+
+    def invalidate(self, path: Sequence[str]):
+        """ Drop the prefetched listing of the path (the folder has changed) """
+        with self.lock:
+            self.results.pop(tuple(path), None)
+
+    def start_workers(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.serve, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def serve(self):
+        while True:
+            negated_generation, _, _, key = self.tasks.get()
+            generation = -negated_generation
+            with self.lock:
+                is_stale = generation <= self.cancelled_generation or generation < self.generation - Prefetcher.MAX_GENERATION_LAG
+                if is_stale:
+                    self.requested.discard(key)
+                    continue
+
+            try:
+                signature = None if self.signature is None else self.signature(key)
+                items = self.entry_lister(list(key))
+            except Exception as e:
+                debug('Prefetcher.serve', path=key, error=str(e))
+                items = None
+
+            with self.lock:
+                self.requested.discard(key)
+                if items is not None and generation > self.cancelled_generation:
+                    self.results[key] = signature, items
+                    while len(self.results) > self.capacity:
+                        self.results.popitem(last=False)
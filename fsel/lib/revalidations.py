@@ -0,0 +1,13 @@
+from typing import Set, Tuple
+
+
+class Revalidations:
+    """ Listings, that have been served before they were checked, and are being checked in the background """
+
+    def is_pending(self) -> bool:
+        """ True while some listings are being checked, or changed_folders() has not reported all the stale ones """
+        return False
+
+    def changed_folders(self) -> Set[Tuple[str, ...]]:
+        """ Folders, whose listings have turned out to be out of date since the last call (they are re-listed) """
+        return set()
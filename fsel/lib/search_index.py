@@ -0,0 +1,88 @@
+from typing import Sequence, List, Tuple, Optional, Dict
+
+from fsel.lib.list_item_info_service import list_item_info_service
+from .fuzzy_matcher import FuzzyMatcher
+from .list_item import ListItem
+from .list_items import ListItems
+
+
+class SearchIndex:
+    """
+    Indices of items, whose file names contain the search string
+    (or, in fuzzy mode, contain its characters in the same order).
+    Keeps the results for the prefixes of the last search string:
+    when a character is appended, only the matches of the previous string are scanned,
+    and on Backspace, the result of the shorter string is reused.
+    In fuzzy mode, matches are also ranked, unless there are more than MAX_RANKED of them.
+    """
+    MAX_RANKED = 1000
+
+    items: Sequence[ListItem]
+    names: Optional[List[str]]
+    lower_names: Optional[List[str]]
+    results: List[Tuple[str, List[int]]]
+    # In fuzzy mode, for the last search string: (string, ranked indices, {index: match positions})
+    ranking: Optional[Tuple[str, List[int], Dict[int, List[int]]]]
+
+    def __init__(self, items: Sequence[ListItem], fuzzy: bool = False):
+        self.items = items
+        self.fuzzy = fuzzy
+        self.reset()
+
+    def reset(self):
+        """ To be called when the items have changed """
+        self.names = None
+        self.lower_names = None
+        self.results = []
+        self.ranking = None
+
+    def matches(self, s: str) -> Sequence[int]:
+        """ Sorted indices of the matching items """
+        if s == '':
+            return range(len(self.items))
+        if self.names is None:
+            self.names = self.items.names if isinstance(self.items, ListItems) \
+                else [list_item_info_service.item_file_name(item) for item in self.items]
+
+        while self.results and not s.startswith(self.results[-1][0]):
+            self.results.pop()
+        if self.results and self.results[-1][0] == s:
+            return self.results[-1][1]
+
+        candidates = self.results[-1][1] if self.results else range(len(self.names))
+        if self.fuzzy:
+            if self.lower_names is None:
+                self.lower_names = [FuzzyMatcher.lower(name) for name in self.names]
+            result = FuzzyMatcher(s).filter(self.lower_names, candidates)
+        else:
+            names = self.names
+            result = [i for i in candidates if s in names[i]]
+        self.results.append((s, result))
+        return result
+
+    def ranked(self, s: str) -> Sequence[int]:
+        """ Indices of the matching items, best first (in fuzzy mode) """
+        matches = self.matches(s)
+        if not self.fuzzy or s == '' or len(matches) > SearchIndex.MAX_RANKED:
+            return matches
+        if self.ranking is None or self.ranking[0] != s:
+            matcher = FuzzyMatcher(s)
+            scored = []
+            positions = {}
+            for i in matches:
+                score, positions[i] = matcher.match(self.names[i])
+                scored.append((-score, i))
+            scored.sort()
+            self.ranking = s, [i for _, i in scored], positions
+        return self.ranking[1]
+
+    def positions(self, s: str, index: int) -> List[int]:
+        """ Positions of the matched characters in the file name of the item """
+        name = self.names[index] if self.names is not None else list_item_info_service.item_file_name(self.items[index])
+        if not self.fuzzy:
+            start = name.find(s)
+            return [] if start < 0 else list(range(start, start + len(s)))
+        if self.ranking is not None and self.ranking[0] == s and index in self.ranking[2]:
+            return self.ranking[2][index]
+        match = FuzzyMatcher(s).match(name)
+        return [] if match is None else match[1]
@@ -1,4 +1,5 @@
-from typing import Optional, List, Dict, Tuple
+import bisect
+from typing import Optional, List, Dict, Tuple, Sequence
 
 from picotui.basewidget import ACTION_CANCEL, ACTION_OK
 from picotui.defs import KEY_QUIT, KEY_ESC, KEY_SHIFT_TAB, KEY_ENTER, KEY_TAB, KEY_RIGHT, KEY_LEFT, KEY_HOME, KEY_END, \
@@ -8,21 +9,32 @@ from picotui.widgets import WListBox
 from .abstract_selection_dialog import AbstractSelectionDialog
 from .custom_list_box import CustomListBox
 from .exit_codes_mapping import KEYS_TO_EXIT_CODES
-from fsel.lib.tui.keys import KEY_ALT_UP, KEY_ALT_DOWN, KEY_ALT_PAGE_UP, KEY_ALT_PAGE_DOWN, KEY_ALT_RIGHT, KEY_ALT_LEFT
-from .list_boxes import ListBoxes
+from fsel.lib.tui.keys import KEY_ALT_UP, KEY_ALT_DOWN, KEY_ALT_PAGE_UP, KEY_ALT_PAGE_DOWN, KEY_ALT_RIGHT, KEY_ALT_LEFT, \
+    KEY_IDLE, KEY_ALT_SLASH
 from fsel.lib.list_item_info_service import list_item_info_service
+from .list_boxes import ListBoxes
+from .list_item import ListItem
 from .logging import debug
 from fsel.lib.tui.picotui_keys import KEY_ALT_HOME
+from fsel.lib.tui.picotui_patch import input_ready
 
 
 class SelectPathDialog(AbstractSelectionDialog):
-    def __init__(self, folder_lists: ListBoxes, screen_width, screen_height, width, height, x, y):
+    IDLE_TIMEOUT = 0.05
+
+    def __init__(self, folder_lists: ListBoxes, screen_width, screen_height, width, height, x, y, project_index=None):
         super().__init__(screen_height, x, y, width, height)
         self.screen_width = screen_width
         self.folder_lists = folder_lists
+        # Global search (Alt+/): the query, when active, and the box with the paths from project_index, that match it
+        self.project_index = project_index
+        self.global_query: Optional[str] = None
+        self.global_matches: Optional[List[Tuple[str, int]]] = None
+        self.global_box: Optional[CustomListBox] = None
         folder_lists.expand_lists()
         self.layout()
         self.make_focused_column_visible(True)
+        folder_lists.prefetch_around(self.focus_idx)
 
     def layout(self):
         debug("SelectPathDialog.layout", boxes_length=len(self.folder_lists.boxes))
@@ -32,6 +44,7 @@ class SelectPathDialog(AbstractSelectionDialog):
 
         for i, child in enumerate(self.folder_lists.boxes):
             child.h = child.height = min(len(child.items), self.h)
+            child.resolve_viewport()
             self.add(child_x, 0, child)
             child_x += child.width + 1
             if child.focus:
@@ -63,9 +76,38 @@ class SelectPathDialog(AbstractSelectionDialog):
     def handle_mouse(self, x, y):
         pass
 
+    def get_input(self):
+        if not self.kbuf:
+            timeout = SelectPathDialog.IDLE_TIMEOUT if self.has_background_work() else None
+            # changes of the folders of the boxes are handled, when not in global search
+            watched_fds = self.folder_lists.watched_fds() if self.global_query is None else []
+            if (timeout is not None or watched_fds) and not input_ready(timeout, watched_fds):
+                return KEY_IDLE
+        return super().get_input()
+
+    def has_background_work(self) -> bool:
+        if self.global_query is not None:
+            return self.project_index.is_building()
+        return self.folder_lists.has_pending_scans() or self.folder_lists.has_pending_decorations() \
+            or self.folder_lists.has_pending_revalidations()
+
+    def handle_idle(self):
+        if self.folder_lists.refresh_changed() | self.folder_lists.poll_scans():
+            self.layout()
+            self.make_focused_column_visible(False)
+            self.redraw()
+        elif self.folder_lists.poll_decorations():
+            self.redraw()
+
     def handle_key(self, key):
+        if self.global_query is not None:
+            return self.handle_global_search_key(key)
+        if key == KEY_IDLE:
+            return self.handle_idle()
         if key == KEY_QUIT:
             return KEY_QUIT
+        if key == KEY_ALT_SLASH and self.project_index is not None:
+            return self.start_global_search()
         if key == KEY_ESC and self.finish_on_esc:
             return ACTION_CANCEL
         if key == KEY_ALT_HOME:
@@ -90,6 +132,7 @@ class SelectPathDialog(AbstractSelectionDialog):
             self.make_focused_column_visible(True)
             self.folder_lists.boxes[self.focus_idx].make_cur_line_visible()
             self.redraw()
+            self.folder_lists.prefetch_around(self.focus_idx)
         elif key == KEY_LEFT:
             # self.folder_lists.search()
             self.layout()
@@ -98,6 +141,7 @@ class SelectPathDialog(AbstractSelectionDialog):
             self.make_focused_column_visible(False)
             self.folder_lists.boxes[self.focus_idx].make_cur_line_visible()
             self.redraw()
+            self.folder_lists.prefetch_around(self.focus_idx)
         elif key == KEY_HOME:
             # self.folder_lists.search()
             self.layout()
@@ -106,6 +150,7 @@ class SelectPathDialog(AbstractSelectionDialog):
             self.make_focused_column_visible(False)
             self.folder_lists.boxes[self.focus_idx].make_cur_line_visible()
             self.redraw()
+            self.folder_lists.prefetch_around(self.focus_idx)
         elif key == KEY_END:
             # self.folder_lists.search()
             self.layout()
@@ -114,6 +159,7 @@ class SelectPathDialog(AbstractSelectionDialog):
             self.make_focused_column_visible(True)
             self.folder_lists.boxes[self.focus_idx].make_cur_line_visible()
             self.redraw()
+            self.folder_lists.prefetch_around(self.focus_idx)
         elif self.focus_w:
             if key == KEY_SHIFT_TAB:
                 self.focus_idx = -1
@@ -141,6 +187,7 @@ class SelectPathDialog(AbstractSelectionDialog):
                 self.folder_lists.activate_sibling(self.focus_idx)
                 self.layout()
                 self.redraw()
+                self.folder_lists.prefetch_around(self.focus_idx)
 
             # if res == ACTION_PREV:
             #     self.move_focus(-1)
@@ -153,6 +200,66 @@ class SelectPathDialog(AbstractSelectionDialog):
     def items_path(self):
         return self.folder_lists.items_path(self.focus_idx)
 
+    def start_global_search(self):
+        self.project_index.start()
+        self.global_query = ''
+        self.show_global_matches()
+
+    def stop_global_search(self):
+        self.global_query = self.global_matches = self.global_box = None
+        self.layout()
+        self.make_focused_column_visible(True)
+        self.redraw()
+
+    def handle_global_search_key(self, key):
+        if key == KEY_QUIT:
+            return KEY_QUIT
+        if key == KEY_ESC:
+            self.stop_global_search()
+        elif key == KEY_ENTER:
+            if self.global_matches:
+                path = list_item_info_service.item_file_name(self.global_box.items[self.global_box.cur_line])
+                self.global_query = self.global_matches = self.global_box = None
+                self.folder_lists.jump_to(path.split('/'))
+                self.x = 0
+                self.layout()
+                self.make_focused_column_visible(True)
+                self.redraw()
+                self.folder_lists.prefetch_around(self.focus_idx)
+        elif key == KEY_IDLE:
+            self.show_global_matches(True)
+        elif key == KEY_BACKSPACE:
+            self.global_query = self.global_query[:-1]
+            self.show_global_matches()
+        elif key == KEY_UP or key == KEY_DOWN or key == KEY_PGUP or key == KEY_PGDN:
+            self.global_box.handle_key(key)
+        elif type(key) is bytes and not key.startswith(b'\x1b'):
+            self.global_query += key.decode("utf-8")
+            self.show_global_matches()
+
+    def show_global_matches(self, only_if_changed: bool = False):
+        """ Replace the boxes with the list of matching paths (or with the query, if nothing matches) """
+        matches = self.project_index.search(self.global_query, self.screen_height) if self.global_query else []
+        if only_if_changed and matches == self.global_matches:
+            return
+        self.global_matches = matches
+        items = [ListItem(name=path, attrs=attrs, description=None) for path, attrs in matches] \
+            or [ListItem(name='/' + self.global_query, attrs=0, description=None)]
+        self.global_box = CustomListBox(
+            min(list_item_info_service.max_item_text_length(items), self.screen_width),
+            len(items),
+            items,
+            search_string_supplier=lambda: self.global_query
+        )
+        self.request_height(len(items))
+        self.global_box.h = self.global_box.height = min(len(items), self.h)
+        self.childs = []
+        self.add(-self.x, 0, self.global_box)
+        # the focused folder box keeps its focus flag: layout() restores the focus, when global search is over
+        self.focus_w = self.global_box
+        self.global_box.focus = True
+        self.redraw()
+
     def handle_search_key(self, key):
         debug("handle_search_key", key=key)
         widget: WListBox = self.focus_w
@@ -218,54 +325,59 @@ class SelectPathDialog(AbstractSelectionDialog):
         return True
 
     def search_widget_last(self, widget):
-        self.search_widget_and_scroll(range(len(widget.items) - 1, widget.cur_line, -1), False, widget)
+        rows = self.match_rows(widget)
+        if rows and rows[-1] > widget.cur_line:
+            self.scroll_to_match(widget, rows[-1])
 
     def search_widget_first(self, widget):
-        self.search_widget_and_scroll(range(0, len(widget.items)), False, widget)
+        rows = self.match_rows(widget)
+        if rows:
+            self.scroll_to_match(widget, rows[0])
 
     def search_widget_down(self, widget):
-        self.search_widget_and_scroll(range(widget.cur_line + 1, len(widget.items)), False, widget)
+        rows = self.match_rows(widget)
+        i = bisect.bisect_right(rows, widget.cur_line)
+        if i < len(rows):
+            self.scroll_to_match(widget, rows[i])
 
     def search_widget_up(self, widget):
-        self.search_widget_and_scroll(range(widget.cur_line - 1, -1, -1), False, widget)
-
-    def search_widget_all(self, widget: WListBox, skip_if_on_match=True):
-        return self.search_widget_and_scroll(range(widget.cur_line, widget.cur_line + len(widget.items)), skip_if_on_match, widget)
-
-    def search_widget_and_scroll(self, search_range, skip_if_on_match, widget: CustomListBox):
-        if self.folder_lists.match_string != '':
-            if skip_if_on_match and list_item_info_service.item_file_name(widget.items[widget.cur_line]).find(self.folder_lists.match_string) != -1:
-                return
-            for j in search_range:
-                i = j % len(widget.items)
-                if list_item_info_service.item_file_name(widget.items[i]).find(self.folder_lists.match_string) != -1:
-                    widget.cur_line = widget.choice = i
-                    widget.make_cur_line_visible()
-                    return i
-
-    def search_widget_get_matches(self, widget: WListBox) -> Tuple[int, int, List[int]]:
-        match_count = 0
-        last_match_line = 0
-        match_indices = []
-        if self.folder_lists.match_string != '':
-            for i in range(0, len(widget.items)):
-                if list_item_info_service.item_file_name(widget.items[i]).find(self.folder_lists.match_string) != -1:
-                    match_count += 1
-                    last_match_line = i
-                    match_indices.append(i)
-        return match_count, last_match_line, match_indices
-
-    def matches_in_boxes(self) -> Tuple[int, int, int, Dict[int, List[int]]]:
+        rows = self.match_rows(widget)
+        i = bisect.bisect_left(rows, widget.cur_line) - 1
+        if i >= 0:
+            self.scroll_to_match(widget, rows[i])
+
+    def search_widget_all(self, widget: CustomListBox, skip_if_on_match=True) -> Optional[int]:
+        """ Scroll to the nearest match at or after the current line, wrapping around """
+        rows = self.match_rows(widget)
+        if not rows:
+            return None
+        i = bisect.bisect_left(rows, widget.cur_line)
+        if skip_if_on_match and i < len(rows) and rows[i] == widget.cur_line:
+            return None
+        return self.scroll_to_match(widget, rows[i] if i < len(rows) else rows[0])
+
+    @staticmethod
+    def scroll_to_match(widget: CustomListBox, line: int) -> int:
+        widget.cur_line = widget.choice = line
+        widget.make_cur_line_visible()
+        return line
+
+    def match_rows(self, widget: CustomListBox) -> Sequence[int]:
+        if self.folder_lists.match_string == '':
+            return []
+        return widget.matching_rows(self.folder_lists.match_string)
+
+    def matches_in_boxes(self) -> Tuple[int, int, int, Dict[int, Sequence[int]]]:
         count = 0
         last_line = 0
         last_idx = 0
         match_indices_by_widget = {}
         for idx in range(0, len(self.folder_lists.boxes)):
-            matches_in_widget, last_match_line, match_indices = self.search_widget_get_matches(self.folder_lists.boxes[idx])
-            if matches_in_widget > 0:
-                count += matches_in_widget
+            match_indices = self.match_rows(self.folder_lists.boxes[idx])
+            if len(match_indices) > 0:
+                count += len(match_indices)
                 last_idx = idx
-                last_line = last_match_line
+                last_line = match_indices[-1]
                 match_indices_by_widget[idx] = match_indices
         return count, last_idx, last_line, match_indices_by_widget
 
@@ -0,0 +1,49 @@
+import queue
+import threading
+from typing import Iterator, Sequence, List
+
+from .list_item import ListItem
+from .logging import debug
+
+
+class StreamingScan:
+    """ Pulls batches of items from an iterator in a background thread; the UI thread drains them when idle """
+
+    def __init__(self, batches: Iterator[Sequence[ListItem]]):
+        self.batches = batches
+        self.queue = queue.SimpleQueue()
+        self.done = False
+        self.cancelled = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            for batch in self.batches:
+                if self.cancelled:
+                    break
+                if batch:
+                    self.queue.put(batch)
+        except Exception as e:
+            debug('StreamingScan.run', error=str(e))
+        finally:
+            self.done = True
+
+    @staticmethod
+    def contains(items: Sequence[ListItem], name: str) -> bool:
+        return any(item.name == name for item in items)
+
+    def drain(self) -> List[ListItem]:
+        """ Items that arrived since the last call """
+        items = []
+        while True:
+            try:
+                items.extend(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def is_finished(self) -> bool:
+        return self.done and self.queue.empty()
+
+    def cancel(self):
+        self.cancelled = True
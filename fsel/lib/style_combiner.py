@@ -1,4 +1,5 @@
 from stat import S_ISVTX, S_ISGID, S_ISUID
+from typing import Dict, Tuple
 
 from fsel.lib.list_item_info_service import ListItemInfoService
 from fsel.lib.tui.attribute import Attribute
@@ -67,16 +68,71 @@ class StyleCombiner:
             [Color.CYAN, Color.BLACK, Color.B_RED]
         ]
 
+        IGNORED = [
+            # non focused list; non highlighted entry
+            [Color.BLACK, Color.DARK_GRAY, Color.B_RED],
+            # non focused list; highlighted entry
+            [Color.BLUE, Color.DARK_GRAY, Color.B_RED],
+            # focused list; non highlighted entry
+            [Color.BLACK, Color.DARK_GRAY, Color.B_RED],
+            # focused list; highlighted entry
+            [Color.CYAN, Color.BLACK, Color.B_RED]
+        ]
+
+        GIT_MODIFIED = [
+            # non focused list; non highlighted entry
+            [Color.BLACK, (255, 176, 64), Color.B_RED],
+            # non focused list; highlighted entry
+            [Color.BLUE, (255, 176, 64), Color.B_RED],
+            # focused list; non highlighted entry
+            [Color.BLACK, (255, 176, 64), Color.B_RED],
+            # focused list; highlighted entry
+            [Color.CYAN, (255, 176, 64), Color.B_RED]
+        ]
+
+        GIT_UNTRACKED = [
+            # non focused list; non highlighted entry
+            [Color.BLACK, (112, 208, 112), Color.B_RED],
+            # non focused list; highlighted entry
+            [Color.BLUE, (112, 208, 112), Color.B_RED],
+            # focused list; non highlighted entry
+            [Color.BLACK, (112, 208, 112), Color.B_RED],
+            # focused list; highlighted entry
+            [Color.CYAN, (112, 208, 112), Color.B_RED]
+        ]
+
+    # item attributes, that select the palette
+    PALETTE_FLAGS = ListItemInfoService.FLAG_DIRECTORY | S_ISVTX | S_ISGID | S_ISUID | ListItemInfoService.FLAG_IGNORED \
+        | ListItemInfoService.FLAG_GIT_MODIFIED | ListItemInfoService.FLAG_GIT_UNTRACKED \
+        | ListItemInfoService.FLAG_GIT_IGNORED
+
     colors: list[int]
+    styles: Dict[Tuple[int, Style], Style]
 
     def __init__(self, attrs: int, focused_list: bool, focused_entry: bool) -> None:
         self.colors = StyleCombiner._get_colors(attrs, focused_list, focused_entry)
+        self.styles = {}
+
+    @staticmethod
+    def of(attrs: int, focused_list: bool, focused_entry: bool) -> 'StyleCombiner':
+        """ Shared instance for the palette: there are few of them, and each one memoizes the styles it combines """
+        key = (attrs & StyleCombiner.PALETTE_FLAGS, focused_list, focused_entry)
+        combiner = _combiners.get(key)
+        if combiner is None:
+            combiner = _combiners[key] = StyleCombiner(*key)
+        return combiner
 
     @staticmethod
     def _get_colors(attrs: int, focused_list: bool, focused_entry: bool) -> list[int]:
         """ category: one of C_IDX_* constants """
 
-        if (attrs & ListItemInfoService.FLAG_DIRECTORY) and (attrs & S_ISVTX):
+        if attrs & (ListItemInfoService.FLAG_IGNORED | ListItemInfoService.FLAG_GIT_IGNORED):
+            _colors = StyleCombiner.Colors.IGNORED
+        elif attrs & ListItemInfoService.FLAG_GIT_MODIFIED:
+            _colors = StyleCombiner.Colors.GIT_MODIFIED
+        elif attrs & ListItemInfoService.FLAG_GIT_UNTRACKED:
+            _colors = StyleCombiner.Colors.GIT_UNTRACKED
+        elif (attrs & ListItemInfoService.FLAG_DIRECTORY) and (attrs & S_ISVTX):
             _colors = StyleCombiner.Colors.STICKY_FOLDER
         elif (attrs & ListItemInfoService.FLAG_DIRECTORY) and (attrs & S_ISGID):
             _colors = StyleCombiner.Colors.SGID_FOLDER
@@ -93,8 +149,15 @@ class StyleCombiner:
         return self.style_for(Attribute.MASK_BG_EMPHASIZED, style)
 
     def style_for(self, base_attr, style):
-        return Style(
-            attr=(style.attr | base_attr),
-            fg=style.fg if style.fg is not None else self.colors[StyleCombiner.Colors.C_IDX_REG_FG],
-            bg=style.bg if style.bg is not None else self.colors[StyleCombiner.Colors.C_IDX_BG]
-        )
+        key = (base_attr, style)
+        result = self.styles.get(key)
+        if result is None:
+            result = self.styles[key] = Style.of(
+                attr=(style.attr | base_attr),
+                fg=style.fg if style.fg is not None else self.colors[StyleCombiner.Colors.C_IDX_REG_FG],
+                bg=style.bg if style.bg is not None else self.colors[StyleCombiner.Colors.C_IDX_BG]
+            )
+        return result
+
+
+_combiners: Dict[Tuple[int, bool, bool], StyleCombiner] = {}
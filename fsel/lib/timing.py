@@ -0,0 +1,36 @@
+import sys
+import time
+from typing import List, Tuple
+
+
+class StartupTiming:
+    """ Durations of startup phases; each phase lasts from the previous mark to its own mark """
+    enabled: bool = False
+    phases: List[Tuple[str, float]]
+
+    def __init__(self):
+        self.restart()
+
+    def restart(self):
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def mark_once(self, phase: str):
+        if all(name != phase for name, _ in self.phases):
+            self.mark(phase)
+
+    def report(self, file=sys.stderr):
+        if not self.enabled:
+            return
+        for name, duration in self.phases:
+            print(f'{name:>16}: {duration * 1000:8.1f} ms', file=file)
+        total = sum(duration for _, duration in self.phases)
+        print(f'{"total":>16}: {total * 1000:8.1f} ms', file=file)
+
+
+startup_timing = StartupTiming()
@@ -0,0 +1,103 @@
+from array import array
+from typing import Dict, List, Set, Iterable
+
+
+def trigrams(s: str) -> Set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class TrigramIndex:
+    """
+    Case-insensitive substring search over a growing list of strings.
+    Every trigram of every string has a posting list of ids of the strings, that contain it;
+    candidates for a query are the intersection of the posting lists of its trigrams.
+    Removed strings are only marked as such, and get their ids back, if they are added again;
+    once they make up COMPACT_RATIO of all strings, compact() drops them, and renumbers the rest.
+    """
+    COMPACT_RATIO = 0.25
+
+    strings: List[str]
+    postings: Dict[str, array]
+
+    def __init__(self):
+        self.strings = []
+        self.lower_strings = []
+        self.removed: Set[int] = set()
+        self.removed_ids: Dict[str, int] = {}
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.strings) - len(self.removed)
+
+    def size(self) -> int:
+        """ Number of ids in use, including the ids of removed strings """
+        return len(self.strings)
+
+    def add(self, s: str) -> int:
+        string_id = self.removed_ids.pop(s, None)
+        if string_id is not None:
+            self.removed.discard(string_id)
+            return string_id
+        string_id = len(self.strings)
+        lower = s.lower()
+        self.strings.append(s)
+        self.lower_strings.append(lower)
+        for trigram in trigrams(lower):
+            posting = self.postings.get(trigram)
+            if posting is None:
+                posting = self.postings[trigram] = array('I')
+            posting.append(string_id)
+        return string_id
+
+    def remove(self, string_id: int):
+        self.removed.add(string_id)
+        self.removed_ids[self.strings[string_id]] = string_id
+
+    def needs_compaction(self) -> bool:
+        return len(self.removed) > len(self.strings) * TrigramIndex.COMPACT_RATIO
+
+    def compact(self) -> List[int]:
+        """ Drops the removed strings; returns the new id of every old id (-1 for the removed ones) """
+        new_ids = []
+        next_id = 0
+        for string_id in range(len(self.strings)):
+            if string_id in self.removed:
+                new_ids.append(-1)
+            else:
+                new_ids.append(next_id)
+                next_id += 1
+        self.strings = [s for string_id, s in enumerate(self.strings) if new_ids[string_id] >= 0]
+        self.lower_strings = [s for string_id, s in enumerate(self.lower_strings) if new_ids[string_id] >= 0]
+        postings = {}
+        for trigram, posting in self.postings.items():
+            # ids keep their order, so the posting lists stay sorted
+            new_posting = array('I', (new_ids[string_id] for string_id in posting if new_ids[string_id] >= 0))
+            if new_posting:
+                postings[trigram] = new_posting
+        self.postings = postings
+        self.removed = set()
+        self.removed_ids = {}
+        return new_ids
+
+    def search(self, query: str) -> Iterable[int]:
+        """ Ids of the strings, that contain query, in the order of addition """
+        lower_query = query.lower()
+        if len(lower_query) < 3:
+            candidates = range(len(self.strings))
+        else:
+            postings = []
+            for trigram in trigrams(lower_query):
+                posting = self.postings.get(trigram)
+                if posting is None:
+                    return
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+            candidates = sorted(candidates)
+
+        lower_strings = self.lower_strings
+        for string_id in candidates:
+            if lower_query in lower_strings[string_id] and string_id not in self.removed:
+                yield string_id
@@ -17,6 +17,7 @@ class Color:
     WHITE = C_WHITE
 
     GRAY = 248
+    DARK_GRAY = 240
     B_RED = 196
     B_GREEN = C_B_GREEN
     B_YELLOW = 227
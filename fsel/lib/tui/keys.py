@@ -8,5 +8,10 @@ KEY_ALT_LEFT = b'\x1b[1;3D'
 KEY_CTRL_RIGHT = b'\x1b[1;5C'
 KEY_CTRL_LEFT = b'\x1b[1;5D'
 
+KEY_ALT_SLASH = b'\x1b/'
+
 KEY_CTRL_HOME = b'\x1b[1;5H'
 KEY_CTRL_END = b'\x1b[1;5F'
+
+# Not a real key: delivered by dialogs, that have background work, when no key was pressed for a while
+KEY_IDLE = b'\x1b[idle'
@@ -1,5 +1,5 @@
 import sys
-from typing import AnyStr
+from typing import AnyStr, List, Optional, Tuple, Dict
 
 from datatools.tui.ansi_str import ANSI_CMD_DEFAULT_FG, ANSI_CMD_ATTR_NOT_BOLD, ANSI_CMD_ATTR_BOLD, ANSI_CMD_DEFAULT_BG, \
     ANSI_CMD_ATTR_NOT_ITALIC, ANSI_CMD_ATTR_ITALIC, ANSI_CMD_ATTR_UNDERLINED, ANSI_CMD_ATTR_NOT_UNDERLINED, \
@@ -8,40 +8,132 @@ from datatools.tui.ansi_str import ANSI_CMD_DEFAULT_FG, ANSI_CMD_ATTR_NOT_BOLD,
 from datatools.tui.terminal import ansi_foreground_escape_code_auto, ansi_background_escape_code_auto
 from picotui.screen import Screen
 
+from fsel.lib.tui import picotui_patch
 from fsel.lib.tui.attribute import Attribute
 from fsel.lib.tui.rich_text import RichText
 from fsel.lib.tui.style import Style
 
 
+Cell = Tuple[str, str]  # character, and the escape sequence, that sets its attributes and colors (after reset)
+UNKNOWN_CELL = ('', '')  # what the terminal shows in the cell is not known
+
+_span_escapes: Dict[Style, Tuple[str, str]] = {}
+
+
 class PaintContext:
-    """ Paint context is a "viewport", that allows to paint text with clipping """
+    """
+    Paint context is a "viewport", that allows to paint text with clipping.
+    Between begin_frames() and end_frames(), painting goes to a back grid of cells;
+    when a frame is flushed, it is compared with the front grid (what the terminal shows),
+    and escape sequences are emitted only for the runs of changed cells.
+    """
+    # Unchanged cells between two changed ones, that are re-sent rather than skipped with a cursor movement
+    MAX_GAP = 6
+    ANSI_RESET = '\x1b[0m'
+
     cur_x: int = sys.maxsize
     cur_y: int = sys.maxsize
     min_x: int = 0
     min_y: int = 0
     max_x: int = 0
     max_y: int = 0
+    back: Optional[List[List[Optional[Cell]]]] = None
+    front: Optional[List[List[Optional[Cell]]]] = None
+    sgr: str = ''  # attributes and colors, set since the last reset (in grid mode)
+
+    def begin_frames(self, synchronized: bool = True):
+        """
+        From now on, paint to the back grid, and write every frame with one write(),
+        when the input is awaited (optionally, as a synchronized update)
+        """
+        self.back = [[None] * self.max_x for _ in range(self.max_y)]
+        self.front = [[UNKNOWN_CELL] * self.max_x for _ in range(self.max_y)]
+        self.sgr = ''
+        picotui_patch.synchronized_update = synchronized
+        picotui_patch.before_flush = self.emit_changes
+        picotui_patch.open_frame()
+
+    def flush(self):
+        picotui_patch.flush_frame()
+
+    def end_frames(self):
+        """ Write the last frame, and write the output directly again """
+        picotui_patch.close_frame()
+        picotui_patch.before_flush = None
+        self.back = self.front = None
+
+    def scroll_up(self, lines: int):
+        """ To be called, when the terminal has been scrolled: the grids are scrolled along """
+        if self.back is not None:
+            self.back = self.back[lines:] + [[None] * self.max_x for _ in range(min(lines, self.max_y))]
+            self.front = self.front[lines:] + [[UNKNOWN_CELL] * self.max_x for _ in range(min(lines, self.max_y))]
+
+    def emit_changes(self):
+        """ Append the escape sequences, that turn the front grid into the back grid, to the frame """
+        out = []
+        for y, (back_row, front_row) in enumerate(zip(self.back, self.front)):
+            if back_row == front_row:
+                continue
+            x = 0
+            n = len(back_row)
+            while x < n:
+                cell = back_row[x]
+                if cell is None or cell == front_row[x]:
+                    x += 1
+                    continue
+                # a run of changed cells, that may include short gaps of unchanged ones
+                end = x + 1
+                j = x + 1
+                while j < n and j - end <= PaintContext.MAX_GAP and back_row[j] is not None:
+                    if back_row[j] != front_row[j]:
+                        end = j + 1
+                    j += 1
+                out.append('\x1b[%d;%dH' % (y + 1, x + 1))
+                sgr = None
+                for cell in back_row[x:end]:
+                    if cell[1] != sgr:
+                        sgr = cell[1]
+                        out.append(PaintContext.ANSI_RESET + sgr)
+                    out.append(cell[0])
+                front_row[x:end] = back_row[x:end]
+                x = end
+        if out:
+            out.append(PaintContext.ANSI_RESET)
+            picotui_patch.frame.extend(''.join(out).encode())
+
+    def sgr_wr(self, s: str):
+        if self.back is not None:
+            self.sgr += s
+        else:
+            Screen.wr(s)
+
+    def fill(self, x: int, text: str, sgr: str):
+        """ Put text to the back grid, at x on the current line (the text must be visible) """
+        self.back[self.cur_y][x:x + len(text)] = [(c, sgr) for c in text]
 
     def attr_reset(self):
-        Screen.attr_reset()
+        if self.back is not None:
+            self.sgr = ''
+        else:
+            Screen.attr_reset()
 
     def attr_reversed(self):
-        Screen.wr("\x1b[7m")
+        self.sgr_wr("\x1b[7m")
 
     def attr_not_reversed(self):
-        Screen.wr("\x1b[27m")
+        self.sgr_wr("\x1b[27m")
 
     def attr_crossed_out(self):
-        Screen.wr("\x1b[9m")
+        self.sgr_wr("\x1b[9m")
 
     def attr_not_crossed_out(self):
-        Screen.wr("\x1b[29m")
+        self.sgr_wr("\x1b[29m")
 
     def attr_italic(self, on: bool):
-        Screen.wr("\x1b[3m" if on else "\x1b[23m")
+        self.sgr_wr("\x1b[3m" if on else "\x1b[23m")
 
     def attr_strike_thru(self, on: bool):
-        Screen.wr("\x1b[9m" if on else "\x1b[29m")
+        self.sgr_wr("\x1b[9m" if on else "\x1b[29m")
 
     def attr_color(self, fg, bg=-1):
         if bg == -1:
@@ -59,12 +151,12 @@ class PaintContext:
         else:
             s += "48;5;%dm" % (bg,)
 
-        Screen.wr(s)
+        self.sgr_wr(s)
 
     def goto(self, x: int, y: int):
         self.cur_x = x
         self.cur_y = y
-        if self.min_x <= x < self.max_x and self.min_y <= y < self.max_y:
+        if self.back is None and self.min_x <= x < self.max_x and self.min_y <= y < self.max_y:
             Screen.goto(x, y)
 
     def clear_box(self, left, top, width, height):
@@ -86,11 +178,13 @@ class PaintContext:
             skip_after = max(0, new_x - self.max_x)
             limit_length = length - skip_after
             fill_length = limit_length - skip_before
-            if fill_length > 0:
+            if fill_length > 0 and self.back is not None:
+                self.fill(x + skip_before, ' ' * fill_length, self.sgr)
+            elif fill_length > 0:
                 if skip_before > 0:
                     Screen.goto(self.min_x, self.cur_y)
                 Screen.wr("\x1b[%dX" % fill_length)
-            if limit_length == skip_before:
+            if limit_length == skip_before and self.back is None:
                 Screen.goto(new_x, self.cur_y)
 
         self.cur_x = new_x
@@ -104,11 +198,13 @@ class PaintContext:
             before = max(0, self.min_x - self.cur_x)
             after = max(0, new_x - self.max_x)
             to = length - after
-            if to > before:
+            if to > before and self.back is not None:
+                self.fill(x + before, s[before:to], self.sgr)
+            elif to > before:
                 if before > 0:
                     Screen.goto(self.min_x, self.cur_y)
                 Screen.wr(s[before:to])
-            if to == before:
+            if to == before and self.back is None:
                 Screen.goto(new_x, self.cur_y)
 
         self.cur_x = new_x
@@ -117,7 +213,8 @@ class PaintContext:
         """Paint rich text from current position with clipping"""
         if self.min_y <= self.cur_y < self.max_y:
             x = self.cur_x
-            
+            positioned = False  # after the first visible span, the cursor is already where the next one starts
+
             for span in rich_text:
                 text = span[0]
                 style = span[1]
@@ -133,16 +230,20 @@ class PaintContext:
                 if to > before:
                     # Apply clipping to text content first
                     clipped_text = text[before:to]
-                    
+
+                    if self.back is not None:
+                        self.fill(x + before, clipped_text, self.span_prefix(style))
+                        x = new_x
+                        continue
+
                     # Format the clipped text with style
                     formatted_text = self.paint_rich_text_span(style, clipped_text)
                     
                     # Position cursor and write formatted text
-                    if before > 0:
-                        Screen.goto(self.min_x, self.cur_y)
-                    else:
-                        Screen.goto(x, self.cur_y)
-                    
+                    if not positioned:
+                        Screen.goto(max(x, self.min_x), self.cur_y)
+                        positioned = True
+
                     Screen.wr(formatted_text)
                 
                 x = new_x
@@ -152,23 +253,44 @@ class PaintContext:
             # If outside vertical bounds, just update cursor position
             self.cur_x += sum(len(span[0]) for span in rich_text)
 
+    def span_prefix(self, style: Style) -> str:
+        """ Escape sequence, that sets the attributes and colors of the style (after reset) """
+        return PaintContext.span_escapes(style)[0]
+
     def paint_rich_text_span(self, style: Style, text: AnyStr) -> AnyStr:
-        result = text
-        if style.fg is not None:
-            result = ansi_foreground_escape_code_auto(style.fg) + result + ANSI_CMD_DEFAULT_FG
-        if style.bg is not None:
-            result = ansi_background_escape_code_auto(style.bg) + result + ANSI_CMD_DEFAULT_BG
-        if style.attr & Attribute.MASK_BOLD != 0:
-            result = ANSI_CMD_ATTR_BOLD + result + ANSI_CMD_ATTR_NOT_BOLD
-        if style.attr & Attribute.MASK_ITALIC != 0:
-            result = ANSI_CMD_ATTR_ITALIC + result + ANSI_CMD_ATTR_NOT_ITALIC
-        if style.attr & Attribute.MASK_UNDERLINED != 0:
-            result = ANSI_CMD_ATTR_UNDERLINED + result + ANSI_CMD_ATTR_NOT_UNDERLINED
-        if style.attr & Attribute.MASK_CROSSED_OUT != 0:
-            result = ANSI_CMD_ATTR_CROSSED_OUT + result + ANSI_CMD_ATTR_NOT_CROSSED_OUT
-        if style.attr & Attribute.MASK_BG_EMPHASIZED != 0:
-            result = ANSI_CMD_ATTR_INVERTED + result + ANSI_CMD_ATTR_NOT_INVERTED
-        return result
+        prefix, suffix = PaintContext.span_escapes(style)
+        return prefix + text + suffix
+
+    @staticmethod
+    def span_escapes(style: Style) -> Tuple[str, str]:
+        """ Escape sequences, that set, and then unset, the attributes and colors of the style; computed once per style """
+        escapes = _span_escapes.get(style)
+        if escapes is None:
+            prefix = ''
+            suffix = ''
+            if style.attr & Attribute.MASK_BG_EMPHASIZED != 0:
+                prefix += ANSI_CMD_ATTR_INVERTED
+                suffix = ANSI_CMD_ATTR_NOT_INVERTED + suffix
+            if style.attr & Attribute.MASK_CROSSED_OUT != 0:
+                prefix += ANSI_CMD_ATTR_CROSSED_OUT
+                suffix = ANSI_CMD_ATTR_NOT_CROSSED_OUT + suffix
+            if style.attr & Attribute.MASK_UNDERLINED != 0:
+                prefix += ANSI_CMD_ATTR_UNDERLINED
+                suffix = ANSI_CMD_ATTR_NOT_UNDERLINED + suffix
+            if style.attr & Attribute.MASK_ITALIC != 0:
+                prefix += ANSI_CMD_ATTR_ITALIC
+                suffix = ANSI_CMD_ATTR_NOT_ITALIC + suffix
+            if style.attr & Attribute.MASK_BOLD != 0:
+                prefix += ANSI_CMD_ATTR_BOLD
+                suffix = ANSI_CMD_ATTR_NOT_BOLD + suffix
+            if style.bg is not None:
+                prefix += ansi_background_escape_code_auto(style.bg)
+                suffix = ANSI_CMD_DEFAULT_BG + suffix
+            if style.fg is not None:
+                prefix += ansi_foreground_escape_code_auto(style.fg)
+                suffix = ANSI_CMD_DEFAULT_FG + suffix
+            escapes = _span_escapes[style] = prefix, suffix
+        return escapes
 
 
 p_ctx = PaintContext()
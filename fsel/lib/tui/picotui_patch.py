@@ -8,6 +8,17 @@ FD_OUT = 2
 
 
 import os
+from typing import Optional, Sequence, Callable
+
+# While open, output is collected here, and written with one write() per frame: before waiting for input
+frame: Optional[bytearray] = None
+# Frames are wrapped into "synchronized update" markers (DEC private mode 2026): terminals, that support it,
+# show every frame at once, without tearing; others ignore the markers
+SYNC_BEGIN = b"\x1b[?2026h"
+SYNC_END = b"\x1b[?2026l"
+synchronized_update = True
+# Called before a frame is written: may add more output to it (see PaintContext.emit_changes)
+before_flush: Optional[Callable[[], None]] = None
 
 
 def wr(*args):
@@ -15,7 +26,37 @@ def wr(*args):
     # TODO: When Python is 3.5, update this to use only bytes
     if isinstance(s, str):
         s = bytes(s, "utf-8")
-    os.write(FD_OUT, s)
+    if frame is not None:
+        frame.extend(s)
+    else:
+        write_fully(s)
+
+
+def write_fully(data: bytes):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(FD_OUT, view):]
+
+
+def open_frame():
+    global frame
+    if frame is None:
+        frame = bytearray()
+
+
+def flush_frame():
+    if frame is not None and before_flush is not None:
+        before_flush()
+    if frame:
+        data = SYNC_BEGIN + frame + SYNC_END if synchronized_update else bytes(frame)
+        frame.clear()
+        write_fully(data)
+
+
+def close_frame():
+    global frame
+    flush_frame()
+    frame = None
 
 
 from picotui.basewidget import Widget
@@ -27,6 +68,7 @@ def get_input(self):
         key = self.kbuf[0:1]
         self.kbuf = self.kbuf[1:]
     else:
+        flush_frame()
         key = os.read(FD_IN, 32)
         if key[0] != 0x1b:
             key = key.decode()
@@ -42,8 +84,16 @@ def get_input(self):
     return key
 
 
+def input_ready(timeout: Optional[float], other_fds: Sequence[int] = ()) -> bool:
+    """ Wait for input, or for any of other_fds to become readable (without timeout, if None): True if input is ready """
+    import select
+    flush_frame()
+    return FD_IN in select.select([FD_IN, *other_fds], [], [], timeout)[0]
+
+
 def read_screen_size(*args):
     import select
+    flush_frame()
     res = select.select([FD_IN], [], [], 0.05)[0]
     if not res:
         return 80, 24
@@ -68,6 +118,7 @@ def screen_size_or_default(*args):
 def cursor_position():
     wr(b"\x1b[6n")
     import select
+    flush_frame()
     res = select.select([FD_IN], [], [], 0.05)[0]
     if not res:
         return None
@@ -1,19 +1,27 @@
 from dataclasses import dataclass
-from typing import Sequence
+from typing import Sequence, Dict, Tuple
 
 
-@dataclass
+@dataclass(frozen=True)
 class Style:
+    """ Immutable; use Style.of() to get the interned instance, that is shared by all equal styles """
     attr: int = 0   # Collection of flags from AbstractBufferWriter
     fg: int | Sequence[int] | None = None
     bg: int | Sequence[int] | None = None
 
     def with_attr(self, attr: int):
-        return Style(
-            attr = attr,
-            fg = self.fg,
-            bg = self.bg,
-        )
+        return Style.of(attr, self.fg, self.bg)
 
     def with_attr_flag(self, flag: int):
-        return self.with_attr(self.attr | flag)
\ No newline at end of file
+        return self.with_attr(self.attr | flag)
+
+    @staticmethod
+    def of(attr: int = 0, fg: int | Sequence[int] | None = None, bg: int | Sequence[int] | None = None) -> 'Style':
+        key = (attr, fg, bg)
+        style = _interned.get(key)
+        if style is None:
+            style = _interned[key] = Style(attr, fg, bg)
+        return style
+
+
+_interned: Dict[Tuple, Style] = {}
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple, Set
+
+from fsel.fs_lister import FsListFiles
+from fsel.lib.list_item_info_service import ListItemInfoService
+from fsel.lib.logging import debug
+from fsel.lib.trigram_index import TrigramIndex
+
+
+class ProjectIndex:
+    """
+    Paths (relative to the root) of everything, that FsListFiles lists under the root, with a trigram index over them.
+    Built by a walk in a background thread, and searchable while it is being built.
+    Every folder is walked with its signature (mtime, inode): the next start() re-walks only the folders,
+    that have changed since, adding new entries and removing vanished ones.
+    Folders, that are found, but not walked yet, have the signature None: a walk, that has been interrupted
+    (or left behind in the server by a forked session), is completed by the next start().
+    Symlinked and ignored folders are not walked.
+    At most MAX_PATHS ids are used, including the ids of removed paths (see TrigramIndex.compact).
+    """
+    MAX_PATHS = 200000
+
+    def __init__(self, lister: FsListFiles):
+        self.lister = lister
+        self.root = lister.root
+        self.index = TrigramIndex()
+        self.ids: Dict[str, int] = {}
+        self.attrs: List[int] = []
+        self.children: Dict[str, Set[str]] = {}
+        self.signatures: Dict[str, Optional[Tuple[int, ...]]] = {}
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def start(self):
+        """ Build the index, or bring it up to date """
+        if self.is_building():
+            return
+        self.worker = threading.Thread(target=self.walk, daemon=True)
+        self.worker.start()
+
+    def is_building(self) -> bool:
+        return self.worker is not None and self.worker.is_alive()
+
+    def walk(self):
+        started = time.time()
+        if self.signatures:
+            pending = deque(
+                folder for folder, signature in list(self.signatures.items())
+                if self.lister.signature(ProjectIndex.path_of(folder)) != signature
+            )
+        else:
+            pending = deque([''])
+        while pending and self.index.size() < ProjectIndex.MAX_PATHS:
+            self.index_folder(pending.popleft(), pending)
+            time.sleep(0)  # let the UI thread handle input
+        debug('ProjectIndex.walk', root=self.root, paths=len(self.index), seconds=time.time() - started)
+
+    def index_folder(self, folder: str, pending: deque):
+        signature = self.lister.signature(ProjectIndex.path_of(folder))
+        try:
+            entries = {
+                (folder + '/' + item.name if folder else item.name): item.attrs
+                for item in self.lister.iter_entries(ProjectIndex.path_of(folder))
+            }
+        except OSError:
+            entries = {}
+
+        with self.lock:
+            if folder != '' and folder not in self.ids:
+                return  # removed while pending
+            self.signatures[folder] = signature
+            for path in self.children.get(folder, set()) - entries.keys():
+                self.remove(path)
+            for path, attrs in entries.items():
+                if path in self.ids:
+                    continue
+                string_id = self.ids[path] = self.index.add(path)
+                if string_id < len(self.attrs):
+                    self.attrs[string_id] = attrs  # the id of the path, that has been removed before
+                else:
+                    self.attrs.append(attrs)
+                if attrs & ListItemInfoService.FLAG_DIRECTORY \
+                        and not attrs & (ListItemInfoService.FLAG_ITALIC | ListItemInfoService.FLAG_IGNORED):
+                    self.signatures[path] = None
+                    pending.append(path)
+            self.children[folder] = set(entries.keys())
+            if self.index.needs_compaction():
+                self.compact()
+
+    def remove(self, path: str):
+        """ Removes the path with all its descendants """
+        self.index.remove(self.ids.pop(path))
+        self.signatures.pop(path, None)
+        for child in self.children.pop(path, ()):
+            self.remove(child)
+
+    def compact(self):
+        new_ids = self.index.compact()
+        self.ids = {path: new_ids[string_id] for path, string_id in self.ids.items()}
+        self.attrs = [attrs for string_id, attrs in enumerate(self.attrs) if new_ids[string_id] >= 0]
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, int]]:
+        """ (path, attrs) of the paths, that contain query; matches in the last path component first, then shorter paths """
+        with self.lock:
+            ids = []
+            for string_id in self.index.search(query):
+                ids.append(string_id)
+                if len(ids) >= limit * 8:
+                    break
+            matches = [(self.index.strings[string_id], self.attrs[string_id]) for string_id in ids]
+        lower_query = query.lower()
+        matches.sort(key=lambda match: (lower_query not in os.path.basename(match[0]).lower(), len(match[0]), match[0]))
+        return matches[:limit]
+
+    @staticmethod
+    def path_of(folder: str) -> List[str]:
+        return folder.split('/') if folder else []
@@ -0,0 +1,66 @@
+import bisect
+import os
+from typing import List, Optional, Iterable
+
+
+class RootsRegistry:
+    """
+    Sorted list of registered roots, persisted one per line in a small file.
+    Supports longest-prefix lookup of the root, that owns a path.
+    """
+    roots: List[str]
+
+    def __init__(self, file_name: Optional[str] = None):
+        self.file_name = file_name
+        self.roots = []
+
+    def load(self) -> bool:
+        """ False if there is no registry file yet """
+        try:
+            with open(self.file_name) as f:
+                self.roots = sorted(line for line in f.read().split('\n') if line)
+            return True
+        except OSError:
+            return False
+
+    def __contains__(self, root: str) -> bool:
+        i = bisect.bisect_left(self.roots, root)
+        return i < len(self.roots) and self.roots[i] == root
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def __len__(self):
+        return len(self.roots)
+
+    def add(self, root: str):
+        i = bisect.bisect_left(self.roots, root)
+        if i == len(self.roots) or self.roots[i] != root:
+            self.roots.insert(i, root)
+
+    def update(self, roots: Iterable[str]):
+        for root in roots:
+            self.add(root)
+
+    def owning_root(self, path: str) -> Optional[str]:
+        """ The longest registered root, that is path itself or its ancestor (ancestors are looked up, nearest first) """
+        while True:
+            if path in self:
+                return path
+            if path == '/' or '/' not in path:
+                return None
+            path = path[:path.rfind('/')] or '/'
+
+    def register(self, root: str):
+        """ Add the root and persist the registry, merging roots registered concurrently by other sessions """
+        if root in self:
+            return
+        self.load()
+        self.add(root)
+        self.store()
+
+    def store(self):
+        tmp_file_name = f'{self.file_name}.{os.getpid()}.tmp'
+        with open(tmp_file_name, 'w') as f:
+            f.write('\n'.join(self.roots) + '\n')
+        os.replace(tmp_file_name, self.file_name)
@@ -1,20 +1,21 @@
-from typing import Dict, Callable
-
-from picotui.widgets import ACTION_CANCEL, ACTION_OK
+from typing import Dict, Callable, TYPE_CHECKING
 
 from .exit_codes import EXIT_CODE_ENTER, EXIT_CODE_ESCAPE
-from .lib.abstract_selection_dialog import AbstractSelectionDialog
-from .lib.exit_codes_mapping import KEYS_TO_EXIT_CODES
-from fsel.lib.tui.paint_context import p_ctx
-from fsel.lib.tui.picotui_patch import patch_picotui
 
-patch_picotui()
-from fsel.lib.tui.picotui_patch import *
+if TYPE_CHECKING:
+    from .lib.abstract_selection_dialog import AbstractSelectionDialog
 
-screen = Screen()
 
+def run_dialog(dialog_supplier: Callable[[int, int, int, int], 'AbstractSelectionDialog']):
+    # TUI modules are imported on first use, so that importing sdk is cheap
+    from fsel.lib.tui.picotui_patch import patch_picotui
+    patch_picotui()
+    from picotui.screen import Screen
+    from picotui.widgets import ACTION_CANCEL, ACTION_OK
+    from fsel.lib.exit_codes_mapping import KEYS_TO_EXIT_CODES
+    from fsel.lib.tui.paint_context import p_ctx
+    from fsel.lib.tui.picotui_patch import cursor_position
 
-def run_dialog(dialog_supplier: Callable[[int, int, int, int], AbstractSelectionDialog]):
     dialog = None
     try:
         Screen.init_tty()
@@ -24,6 +25,7 @@ def run_dialog(dialog_supplier: Callable[[int, int, int, int], AbstractSelection
         cursor_y, cursor_x = cursor_position()
         p_ctx.max_x = screen_width
         p_ctx.max_y = screen_height
+        p_ctx.begin_frames()
 
         dialog = dialog_supplier(screen_height, screen_width, cursor_y, cursor_x)
         res = dialog.loop()
@@ -38,6 +40,8 @@ def run_dialog(dialog_supplier: Callable[[int, int, int, int], AbstractSelection
         Screen.attr_reset()
         if dialog is not None:
             dialog.clear()
+        p_ctx.end_frames()
+        if dialog is not None:
             Screen.goto(0, dialog.y)
 
         Screen.cursor(True)
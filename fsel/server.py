@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+###
+# Resident fsel server (one per user), listening on a Unix socket (see fsel.client).
+# Keeps the imports, the settings folder, the listing caches, the parsed git indexes, git statuses
+# and the project indexes warm between sessions. Every session is served by a forked child, that inherits this warm state;
+# when the session is over, the child reports the folders it has listed, the git indexes and statuses it has used
+# and the project indexes it has searched, and the server brings them up to date in the background.
+# Sessions are forked without waiting for that: they inherit the last finished state, and catch up themselves.
+# (Whatever the child has built itself is lost with it.)
+###
+import json
+import os
+import selectors
+import socket
+import struct
+import sys
+import traceback
+
+# fsel.app imports TUI modules lazily; the server imports them in advance, so that forked sessions do not pay for them
+import fsel.fs_snapshot  # noqa: F401
+import fsel.lib.item_selection_dialog  # noqa: F401
+import fsel.lib.select_path_dialog  # noqa: F401
+from fsel.app import FsAppState, main
+from fsel.client import socket_path, is_private_folder, peer_uid
+from fsel.lib.logging import debug
+from fsel.lib.timing import startup_timing
+
+MAX_REQUEST_SIZE = 65536
+
+
+class FselServer:
+    def __init__(self, path: str):
+        self.path = path
+        self.state = FsAppState()
+        self.selector = selectors.DefaultSelector()
+        self.reports = {}
+
+    def serve_forever(self):
+        listener = self.listen()
+        self.selector.register(listener, selectors.EVENT_READ)
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is listener:
+                    self.accept(listener)
+                else:
+                    self.read_report(key.fileobj)
+
+    def listen(self) -> socket.socket:
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        if not is_private_folder(folder):
+            sys.exit('fsel server: the folder of the socket is not private: ' + folder)
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+            sys.exit('fsel server is already running: ' + self.path)
+        except OSError:
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # stale
+        finally:
+            probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        listener.listen()
+        return listener
+
+    def accept(self, listener: socket.socket):
+        conn, _ = listener.accept()
+        if peer_uid(conn) != os.getuid():
+            conn.close()
+            return
+
+        report_r, report_w = os.pipe()
+        with self.state.locked():
+            pid = os.fork()
+        if pid == 0:
+            listener.close()
+            os.close(report_r)
+            exit_code = 1
+            try:
+                self.serve_session(conn, report_w)
+                exit_code = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(exit_code)
+
+        conn.close()
+        os.close(report_w)
+        report = os.fdopen(report_r, 'rb')
+        self.reports[report] = (pid, bytearray())
+        self.selector.register(report, selectors.EVENT_READ)
+
+    def read_report(self, report):
+        pid, data = self.reports[report]
+        chunk = os.read(report.fileno(), 65536)
+        if chunk:
+            data += chunk
+            return
+
+        self.selector.unregister(report)
+        report.close()
+        del self.reports[report]
+        os.waitpid(pid, 0)
+        try:
+            self.state.warm_up(json.loads(data))
+        except ValueError:
+            debug('FselServer.read_report', pid=pid, report=False)
+
+    def serve_session(self, conn: socket.socket, report_w: int):
+        """ Runs in the forked child """
+        message, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SIZE, 3)
+        request = json.loads(message)
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.update(request['env'])
+        sys.argv = ['fsel', *request['args']]
+        startup_timing.restart()
+
+        exit_code = self.run_session()
+        sys.stdout.flush()
+        conn.sendall(struct.pack('!i', exit_code))
+        conn.close()
+        with os.fdopen(report_w, 'w') as f:
+            json.dump(self.state.report(), f)
+
+    def run_session(self) -> int:
+        try:
+            if sys.stdin.isatty():
+                main(self.state)
+            return 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+            print(e.code, file=sys.stderr)
+            return 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+
+
+if __name__ == "__main__":
+    FselServer(socket_path()).serve_forever()
@@ -0,0 +1,68 @@
+import json
+import time
+from typing import List, Dict, AnyStr, Iterable, Optional, Callable
+
+from fsel.lib.path_oracle import PathOracle
+from fsel.sdk import field_or_else
+
+RECENT_COUNT = 10
+USAGE_STATS_GC_TIME = 'usage-stats-gc-time'
+
+
+def update_recents(recent, rel_path_from_root):
+    if rel_path_from_root != '.':
+        if rel_path_from_root in recent:
+            recent.remove(rel_path_from_root)
+        recent.insert(0, rel_path_from_root)
+        del recent[RECENT_COUNT:]
+
+
+class SettingsJournal:
+    """
+    Changes made to the settings of a root during a session.
+    They are appended to the journal of the root (see AllSettingsFolder.append), instead of rewriting the settings,
+    and folded into the settings when they are loaded.
+    """
+    records: List[Dict]
+
+    def __init__(self):
+        self.records = []
+
+    def memorize(self, path: List[AnyStr], name: AnyStr):
+        self.records.append({'op': 'memorize', 'path': list(path), 'name': name, 't': time.time()})
+
+    def recent(self, field: str, rel_path_from_root: str):
+        self.records.append({'op': 'recent', 'field': field, 'path': rel_path_from_root})
+
+    def forget(self, path: List[AnyStr]):
+        self.records.append({'op': 'forget', 'path': list(path)})
+
+    def usage_stats_checked(self):
+        self.records.append({'op': 'set', 'field': USAGE_STATS_GC_TIME, 'value': time.time()})
+
+    def lines(self) -> str:
+        return ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in list(self.records))
+
+    @staticmethod
+    def fold(settings: Dict, lines: Iterable[str], shard_loader: Optional[Callable[[AnyStr], Dict]] = None):
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # incomplete record, if a session has crashed while writing
+            SettingsJournal.apply(settings, record, shard_loader)
+
+    @staticmethod
+    def apply(settings: Dict, record: Dict, shard_loader: Optional[Callable[[AnyStr], Dict]] = None):
+        op = record.get('op')
+        if op == 'memorize':
+            oracle = PathOracle(field_or_else(settings, 'history', {}), field_or_else(settings, 'usage_stats', {}))
+            oracle.memorize(record['path'], record['name'], True, record.get('t'))
+        elif op == 'recent':
+            update_recents(field_or_else(settings, record['field'], []), record['path'])
+        elif op == 'forget':
+            # forgotten entries may be in shards, that are not loaded yet
+            oracle = PathOracle({}, field_or_else(settings, 'usage_stats', {}), shard_loader=shard_loader)
+            oracle.forget(record['path'])
+        elif op == 'set':
+            settings[record['field']] = record['value']
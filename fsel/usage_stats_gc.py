@@ -0,0 +1,110 @@
+import heapq
+import os
+import threading
+import time
+from typing import Dict, List, AnyStr, Iterator, Optional, Callable
+
+from fsel.lib.logging import debug
+from fsel.lib.path_oracle import PathOracle, SHARD
+from fsel.settings_journal import SettingsJournal, USAGE_STATS_GC_TIME
+
+
+class UsageStatsGc:
+    """
+    Keeps usage stats of a root bounded:
+    entries of paths, that no longer exist under the root, are dropped by an occasional check in the background,
+    and when the journal is compacted, the coldest entries are evicted, until the stats fit in the node budget
+    (setting 'usage-stats-budget' of the root).
+    """
+    NODE_BUDGET = 20000
+    CHECK_INTERVAL = 24 * 3600
+
+    def __init__(self, usage_stats: Dict, shard_loader: Optional[Callable[[AnyStr], Dict]] = None):
+        self.usage_stats = usage_stats
+        self.oracle = PathOracle({}, usage_stats, shard_loader=shard_loader)
+
+    @staticmethod
+    def node_budget(settings: Dict) -> int:
+        return settings.get('usage-stats-budget') or UsageStatsGc.NODE_BUDGET
+
+    @staticmethod
+    def is_check_due(settings: Dict) -> bool:
+        return time.time() - settings.get(USAGE_STATS_GC_TIME, 0) > UsageStatsGc.CHECK_INTERVAL
+
+    def load_all(self, stats: Optional[Dict] = None):
+        """ Loads all shards (shards may be split into shards of their own) """
+        stats = self.usage_stats if stats is None else stats
+        for name in [name for name, entry in stats.items() if isinstance(entry, dict)]:
+            self.load_all(self.oracle.child_entry(stats, name))
+
+    def vanished_paths(self, root: str) -> Iterator[List[AnyStr]]:
+        """ Paths of entries, whose files do not exist; the parent folder of every such path exists """
+        if not os.path.isdir(root):
+            return
+        pending = [[]]
+        while pending:
+            path = pending.pop()
+            entry = self.oracle.get_entry(self.usage_stats, path)
+            for name, child in list(entry.items()):
+                if not isinstance(child, dict):
+                    continue
+                child_path = [*path, name]
+                if not os.path.lexists(os.path.join(root, *child_path)):
+                    yield child_path
+                elif any(k != '.' for k in child):
+                    pending.append(child_path)
+
+    def evict_coldest(self, budget: int) -> int:
+        """ Removes the least frecent leaves (and the parents, that become leaves), until there are at most budget entries """
+        entries = []  # (entry, index of parent, name)
+        child_counts = []
+
+        def collect(entry: Dict, parent: int, name: Optional[AnyStr]):
+            index = len(entries)
+            entries.append((entry, parent, name))
+            child_counts.append(0)
+            for k, v in entry.items():
+                if isinstance(v, dict):
+                    child_counts[index] += 1
+                    collect(v, index, k)
+
+        collect(self.usage_stats, -1, None)
+        excess = len(entries) - 1 - budget
+        if excess <= 0:
+            return 0
+
+        leaves = [(PathOracle.counters(entry)[1], i) for i, (entry, _, _) in enumerate(entries) if i > 0 and child_counts[i] == 0]
+        heapq.heapify(leaves)
+        evicted = 0
+        while evicted < excess and leaves:
+            _, i = heapq.heappop(leaves)
+            _, parent, name = entries[i]
+            parent_entry = entries[parent][0]
+            del parent_entry[name]
+            counters = parent_entry.get('.')
+            if type(counters) is list and counters[2] == name:
+                counters[2] = None
+            evicted += 1
+            child_counts[parent] -= 1
+            if parent > 0 and child_counts[parent] == 0:
+                heapq.heappush(leaves, (PathOracle.counters(parent_entry)[1], parent))
+        return evicted
+
+    def prune_history(self, history: Dict):
+        for key in [key for key in history if self.oracle.get_entry(self.usage_stats, key.split('/') if key else []) is None]:
+            del history[key]
+
+
+def check_in_background(all_settings, root: str, journal: SettingsJournal):
+    """ Records the vanished paths in the journal; the check is recorded as done only if it completes """
+    def check():
+        try:
+            settings = all_settings.load_settings(root)
+            gc = UsageStatsGc(settings.get('usage_stats') or {}, all_settings.shard_loader(root))
+            for path in gc.vanished_paths(root):
+                journal.forget(path)
+            journal.usage_stats_checked()
+        except Exception as e:
+            debug('check_in_background', root=root, error=str(e))
+
+    threading.Thread(target=check, daemon=True).start()
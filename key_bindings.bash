@@ -1,13 +1,23 @@
 #!/bin/bash
 
+# Set FSEL_SERVER=1 to serve the key bindings from the resident server (start it with: python3 -m fsel.server &).
+# If the server is not running, fsel.client runs fsel.app in-process.
+__fsel__() {
+  if [[ -n "$FSEL_SERVER" ]]; then
+    python3 -m fsel.client "$@"
+  else
+    python3 -m fsel.app "$@"
+  fi
+}
+
 __fsel_cat__() {
   local file
-  file=$(python3 -m fsel.app -r -f "$@") && printf "${PAGER:-less} $file"
+  file=$(__fsel__ -r -f "$@") && printf "${PAGER:-less} $file"
 }
 
 __fsel_edit__() {
   local file
-  file=$(python3 -m fsel.app -r -f "$@") && printf "${EDITOR:-nano} $file"
+  file=$(__fsel__ -r -f "$@") && printf "${EDITOR:-nano} $file"
 }
 
 __fsel_cd__() {
@@ -15,7 +25,7 @@ __fsel_cd__() {
   while true; do
     local dir
     local res
-    dir=$(python3 -m fsel.app -W "${args[@]}")
+    dir=$(__fsel__ -W "${args[@]}")
     res=$?
 
     # On Alt+Enter, continue with the link target
@@ -31,12 +41,12 @@ __fsel_cd__() {
 
 __fsel_run__() {
   local file
-  file=$(python3 -m fsel.app -f -x "$@") && printf '%q' "$file"
+  file=$(__fsel__ -f -x "$@") && printf '%q' "$file"
 }
 
 __fsel_widget__() {
   local selected
-  selected=$(python3 -m fsel.app "$@")
+  selected=$(__fsel__ "$@")
   READLINE_LINE="${READLINE_LINE:0:$READLINE_POINT}$selected${READLINE_LINE:$READLINE_POINT}"
   READLINE_POINT=$(( READLINE_POINT + ${#selected} ))
 }